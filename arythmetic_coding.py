@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from decimal import Decimal
-from dba import db
 from math import log, ceil
+from frequency_models import StaticFrequencyModel, \
+        AdaptiveFrequencyModel, ContextFrequencyModel
+from tracing import Traceable
 
-class ArithmeticCoding(object):
+class ArithmeticCoding(Traceable):
     """
-    Represents arithmetic coding algorithm.
+    Represents arithmetic coding algorithm. Intervals of every step are
+    reported to tracer if it's set (see tracing).
 
     symbols_probability - dictitonary with letters and their probabilities 
     input_string - string to be coded
@@ -58,6 +61,7 @@ class ArithmeticCoding(object):
                     )
                 )) + 1
         #convert to binary, discard first three symbols, slice to precision 
+        from dba import db
         code = db(code_point)[3:3 + precision]
         return code
             
@@ -71,8 +75,9 @@ class ArithmeticCoding(object):
         letter - letter which interval is to be returned
         """
         letter_intervals = self._divide_interval(alphabet, interval)
-        print letter_intervals
-        print 
+        if self._tracer is not None:
+            self._trace('interval', letter=letter,
+                    intervals=letter_intervals)
         return letter_intervals[letter]
 
     def _divide_interval(self, alphabet, interval):
@@ -98,7 +103,116 @@ class ArithmeticCoding(object):
         return intervals
 
 
+class RangeCoding(object):
+    """
+    Represents arithmetic coding with fixed precision integers (range
+    coder). Interval is kept as 32-bit low border and range, bytes are
+    emitted as soon as they are known; carry into already emitted bytes
+    is handled by delaying a byte and a run of 0xff bytes.
+
+    model - frequency model (see frequency_models), its total frequency
+        must not exceed frequency_models.MAX_TOTAL_FREQUENCY
+    """
+    _TOP = 1 << 24
+    _MASK = 0xffffffff
+
+    def __init__(self, model):
+        super(RangeCoding, self).__init__()
+        self._model = model
+
+    def get_model(self):
+        """Returns current frequency model."""
+        return self._model
+
+    def encode(self, symbols):
+        """
+        Encodes symbols and returns string of bytes.
+
+        symbols - iterable of symbols known to model
+        """
+        model = self._model
+        model.reset()
+        output = bytearray()
+        top = self._TOP
+        low = 0
+        range_ = self._MASK
+        # delayed byte and quantity of bytes waiting for possible carry
+        cache = 0
+        cache_size = 1
+        for symbol in symbols:
+            symbol_low, symbol_high = model.get_range(symbol)
+            step = range_ // model.get_total()
+            low += step * symbol_low
+            range_ = step * (symbol_high - symbol_low)
+            model.update(symbol)
+            while range_ < top:
+                range_ <<= 8
+                low, cache, cache_size = self._shift_low(output, low,
+                        cache, cache_size)
+        for i in xrange(5):
+            low, cache, cache_size = self._shift_low(output, low, cache,
+                    cache_size)
+        # First byte is always zero
+        return str(output[1:])
+
+    def decode(self, data, count, offset=0):
+        """
+        Decodes count symbols and returns list of them.
+
+        data - string of bytes produced by encode
+        count - quantity of symbols to decode
+        offset - position of coded data in data
+        """
+        model = self._model
+        model.reset()
+        values = bytearray(data[offset:])
+        values.extend('\x00' * 4)
+        mask = self._MASK
+        top = self._TOP
+        code = (values[0] << 24) | (values[1] << 16) | (values[2] << 8) | \
+                values[3]
+        position = 4
+        range_ = mask
+        result = []
+        for i in xrange(count):
+            step = range_ // model.get_total()
+            value = min(code // step, model.get_total() - 1)
+            symbol, symbol_low, symbol_high = model.find_symbol(value)
+            code -= step * symbol_low
+            range_ = step * (symbol_high - symbol_low)
+            model.update(symbol)
+            result.append(symbol)
+            while range_ < top:
+                range_ <<= 8
+                if position >= len(values):
+                    values.append(0)
+                code = ((code << 8) | values[position]) & mask
+                position += 1
+        return result
+
+    def _shift_low(self, output, low, cache, cache_size):
+        """
+        Moves top byte of low border to output (through cache, so carry
+        can still change it). Returns new low, cache and cache size.
+        """
+        if low < 0xff000000 or low > self._MASK:
+            carry = low >> 32
+            byte = cache
+            while True:
+                output.append((byte + carry) & 0xff)
+                byte = 0xff
+                cache_size -= 1
+                if not cache_size:
+                    break
+            cache = (low >> 24) & 0xff
+        cache_size += 1
+        low = (low & 0x00ffffff) << 8
+        return low, cache, cache_size
+
+
 if __name__ == '__main__':
+    from tracing import PrintTracer
+
     alphabet = {
             'a': 0.41,
             'b': 0.23,
@@ -106,5 +220,17 @@ if __name__ == '__main__':
             'd': 0.26,
             }
     initial_string = "acbaa"
+    range_coder = RangeCoding(StaticFrequencyModel.from_probabilities(
+        alphabet))
+    coded = range_coder.encode(initial_string)
+    print repr(coded)
+    print ''.join(range_coder.decode(coded, len(initial_string)))
+    for model in (AdaptiveFrequencyModel(sorted(alphabet)),
+            ContextFrequencyModel(sorted(alphabet), 2)):
+        adaptive_coder = RangeCoding(model)
+        coded = adaptive_coder.encode(initial_string)
+        print repr(coded)
+        print ''.join(adaptive_coder.decode(coded, len(initial_string)))
     coder = ArithmeticCoding(alphabet, initial_string)
+    coder.set_tracer(PrintTracer())
     print coder.get_coded_string()
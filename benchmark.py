@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+import json
+import platform
+from random import Random
+from time import time
+from resource import getrusage, RUSAGE_SELF
+from multiprocessing import Pool
+from coding_algorithms import HuffmanCoding, FanoCoding, \
+        CanonicalHuffmanCoding, AdaptiveHuffmanCoding
+from arythmetic_coding import RangeCoding
+from frequency_models import AdaptiveFrequencyModel, ContextFrequencyModel
+from lzw_coding import LZ78Coding, LZWCoding
+from lz77_coding import LZ77Coding
+from block_sorting import BlockSortingCoding
+from bit_io import BitWriter
+from table_decoding import TableDecoder
+from entropy_utils import count_bytes, find_information_entropy
+import entropy_utils
+
+DEFAULT_SIZES = (1 << 12, 1 << 16, 1 << 18)
+# Words of text-like corpus, drawn with Zipf-like frequencies
+WORDS = ('the of and to in a is that for it as was with be by on not he '
+        'this are or his from at which but have an they you were her she '
+        'there one all we their been has would when if so no will more '
+        'compression code symbol probability letter alphabet entropy tree '
+        'message channel information string block frame table').split()
+
+class Benchmark(object):
+    """
+    Measures coding algorithms on generated corpora: speed of encoding
+    and decoding, peak memory, compression ratio and how far coded size
+    is from entropy of bytes (order-0, so dictionary coders may get below
+    it).
+
+    codecs - names of codecs to measure (keys of CODECS)
+    corpora - names of corpora (keys of CORPORA)
+    sizes - sizes of corpora in bytes
+    repeat - quantity of runs, the fastest one is reported
+    isolate - whether every measurement runs in a new process (peak
+        memory of a measurement can be found only this way)
+    seed - seed of random generator of corpora
+    """
+    def __init__(self, codecs=None, corpora=None, sizes=DEFAULT_SIZES,
+            repeat=3, isolate=True, seed=0):
+        super(Benchmark, self).__init__()
+        self._codecs = codecs or sorted(CODECS)
+        self._corpora = corpora or sorted(CORPORA)
+        self._sizes = sizes
+        self._repeat = repeat
+        self._isolate = isolate
+        self._seed = seed
+
+    def run(self):
+        """Runs all measurements and returns report (see get_report)."""
+        tasks = [(codec, corpus, size, self._repeat, self._seed)
+                for corpus in self._corpora for size in self._sizes
+                for codec in self._codecs]
+        if self._isolate:
+            # Every measurement gets a fresh process
+            pool = Pool(1, maxtasksperchild=1)
+            try:
+                results = [pool.apply(_measure, (task,)) for task in tasks]
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = map(_measure, tasks)
+        return self.get_report(results)
+
+    def get_report(self, results):
+        """
+        Returns dictionary with description of environment and list of
+        results, ready to be dumped to JSON.
+
+        results - list of dictionaries returned by measurements
+        """
+        return {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': entropy_utils.numpy is not None,
+                'repeat': self._repeat,
+                'seed': self._seed,
+                'results': results,
+                }
+
+
+def generate_random(size, random):
+    """Returns bytes distributed uniformly."""
+    return ''.join(chr(random.getrandbits(8)) for i in xrange(size))
+
+
+def generate_skewed(size, random):
+    """Returns bytes with exponentially decreasing probabilities."""
+    return ''.join(chr(min(255, int(random.expovariate(0.3))))
+            for i in xrange(size))
+
+
+def generate_text(size, random):
+    """Returns words separated by spaces and punctuation."""
+    parts = []
+    length = 0
+    while length < size:
+        word = WORDS[min(len(WORDS) - 1, int(random.paretovariate(1.2)) - 1)]
+        if random.random() < 0.08:
+            word += random.choice('.,;\n')
+        parts.append(word)
+        length += len(word) + 1
+    return ' '.join(parts)[:size]
+
+
+def generate_repetitive(size, random):
+    """Returns a phrase repeated with rare changes."""
+    phrase = bytearray(generate_text(64, random))
+    result = bytearray()
+    while len(result) < size:
+        if random.random() < 0.1:
+            phrase[random.randrange(len(phrase))] = random.getrandbits(8)
+        result.extend(phrase)
+    return str(result[:size])
+
+
+CORPORA = {
+        'random': generate_random,
+        'skewed': generate_skewed,
+        'text': generate_text,
+        'repetitive': generate_repetitive,
+        }
+
+
+def _code_prefix(data, coder):
+    """
+    Codes bytes with a prefix code. Returns tuple (coded data, size of
+    table of code lengths, coded alphabet).
+    """
+    numeric_codes = dict((letter, (int(code, 2), len(code)))
+            for letter, code in coder.get_coded_alphabet())
+    writer = BitWriter()
+    writer.write_symbols(data, numeric_codes)
+    # Any prefix code is restored from its code lengths as canonical one
+    # of the same size
+    table = CanonicalHuffmanCoding(code_lengths=coder.get_code_lengths())
+    return writer.get_bytes(), len(table.serialize_code_lengths()), \
+            coder.get_coded_alphabet()
+
+
+def _get_alphabet(data):
+    """Returns dictionary with bytes of data and their probabilities."""
+    total = float(len(data))
+    return dict((chr(value), count / total)
+            for value, count in enumerate(count_bytes(data)) if count)
+
+
+def _encode_huffman(data):
+    return _code_prefix(data, HuffmanCoding(_get_alphabet(data)))
+
+
+def _encode_fano(data):
+    return _code_prefix(data, FanoCoding(_get_alphabet(data)))
+
+
+def _decode_prefix(coded, length):
+    data, table_size, coded_alphabet = coded
+    return TableDecoder(coded_alphabet).decode(data, length)
+
+
+def _encode_arithmetic(data, order=0):
+    if order:
+        model = ContextFrequencyModel(range(256), order)
+    else:
+        model = AdaptiveFrequencyModel(range(256))
+    return RangeCoding(model).encode(bytearray(data)), order
+
+
+def _decode_arithmetic(coded, length):
+    data, order = coded
+    if order:
+        model = ContextFrequencyModel(range(256), order)
+    else:
+        model = AdaptiveFrequencyModel(range(256))
+    return str(bytearray(RangeCoding(model).decode(data, length)))
+
+
+def _encode_lz78(data):
+    coder = LZ78Coding(data)
+    coder.get_coded_string()
+    return coder
+
+
+def _get_lz78_size(coder):
+    # Indexes are written as bits and letters as bytes
+    letters = len([letter for index, letter in coder.get_pairs()
+        if letter is not None])
+    bits = len(coder.get_coded_string()) - letters + 8 * letters
+    return (bits + 7) // 8
+
+
+# Codecs as tuples (encode function, decode function, function returning
+# size of coded data)
+CODECS = {
+        'huffman': (_encode_huffman, _decode_prefix,
+            lambda coded: len(coded[0]) + coded[1]),
+        'fano': (_encode_fano, _decode_prefix,
+            lambda coded: len(coded[0]) + coded[1]),
+        'adaptive-huffman': (lambda data: AdaptiveHuffmanCoding().encode(data),
+            lambda coded, length: AdaptiveHuffmanCoding().decode(coded,
+                length),
+            len),
+        'arithmetic': (_encode_arithmetic, _decode_arithmetic,
+            lambda coded: len(coded[0])),
+        'arithmetic-order1': (lambda data: _encode_arithmetic(data, 1),
+            _decode_arithmetic, lambda coded: len(coded[0])),
+        'lz78': (_encode_lz78,
+            lambda coder, length: LZ78Coding('').decode_string(
+                coder.get_coded_string()),
+            _get_lz78_size),
+        'lzw': (lambda data: LZWCoding(data).get_coded_string(),
+            lambda coded, length: LZWCoding('').decode_string(coded),
+            len),
+        'lz77': (lambda data: LZ77Coding(data).get_coded_string(),
+            lambda coded, length: LZ77Coding('').decode_string(coded),
+            len),
+        'bwt': (lambda data: BlockSortingCoding(data).get_coded_string(),
+            lambda coded, length: BlockSortingCoding('').decode_string(coded),
+            len),
+        'bwt-arithmetic': (lambda data: BlockSortingCoding(data,
+            entropy_coder='arith').get_coded_string(),
+            lambda coded, length: BlockSortingCoding('').decode_string(coded),
+            len),
+        }
+
+
+def _measure(task):
+    """
+    Measures one codec on one corpus and returns dictionary of results.
+
+    task - tuple (codec, corpus, size, repeat, seed)
+    """
+    codec, corpus, size, repeat, seed = task
+    encode, decode, get_size = CODECS[codec]
+    data = CORPORA[corpus](size, Random('%s-%d-%d' % (corpus, size, seed)))
+    # Peak resident memory is kept by system in kilobytes
+    memory_before = getrusage(RUSAGE_SELF).ru_maxrss
+    encode_time = decode_time = None
+    for i in xrange(repeat):
+        started = time()
+        coded = encode(data)
+        elapsed = time() - started
+        encode_time = min(encode_time or elapsed, elapsed)
+        started = time()
+        restored = decode(coded, len(data))
+        elapsed = time() - started
+        decode_time = min(decode_time or elapsed, elapsed)
+    compressed_size = get_size(coded)
+    counts = count_bytes(data)
+    entropy = find_information_entropy(*[count / float(len(data))
+        for count in counts if count])
+    bits_per_byte = 8. * compressed_size / len(data)
+    return {
+            'codec': codec,
+            'corpus': corpus,
+            'size': len(data),
+            'compressed_size': compressed_size,
+            'ratio': float(len(data)) / compressed_size,
+            'bits_per_byte': bits_per_byte,
+            'entropy': entropy,
+            'entropy_gap': bits_per_byte - entropy,
+            'encode_mb_s': len(data) / 1e6 / max(encode_time, 1e-9),
+            'decode_mb_s': len(data) / 1e6 / max(decode_time, 1e-9),
+            'peak_memory_kb': getrusage(RUSAGE_SELF).ru_maxrss -
+                memory_before,
+            'roundtrip': restored == data,
+            }
+
+
+if __name__ == '__main__':
+    """Prints JSON report, run with --help to see options."""
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Benchmark of coding algorithms.')
+    parser.add_argument('--codec', action='append', choices=sorted(CODECS),
+            help='codec to measure (all by default), may be repeated')
+    parser.add_argument('--corpus', action='append',
+            choices=sorted(CORPORA),
+            help='corpus to use (all by default), may be repeated')
+    parser.add_argument('--size', action='append', type=int,
+            help='size of corpora in bytes, may be repeated')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='quantity of runs of every measurement')
+    parser.add_argument('--seed', type=int, default=0,
+            help='seed of random generator of corpora')
+    parser.add_argument('--in-process', action='store_true',
+            help="don't run measurements in separate processes")
+    parser.add_argument('--output', help='file to write report to')
+    arguments = parser.parse_args()
+
+    report = Benchmark(arguments.codec, arguments.corpus,
+            arguments.size or DEFAULT_SIZES, arguments.repeat,
+            not arguments.in_process, arguments.seed).run()
+    if arguments.output:
+        with open(arguments.output, 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
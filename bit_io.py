@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from binascii import hexlify, unhexlify
+from struct import unpack_from
+
+class BitWriter(object):
+    """
+    Packs codes of variable length into bytes. Bits are stored most
+    significant first, last byte is padded with zeros.
+    """
+    # how much bits are gathered in accumulator before moving them to buffer
+    _FLUSH_BITS = 1024
+    # how much symbols are packed at once by write_symbols
+    _CHUNK_SYMBOLS = 1 << 16
+
+    def __init__(self):
+        super(BitWriter, self).__init__()
+        self._buffer = bytearray()
+        self._accumulator = 0
+        self._bits_in_accumulator = 0
+        self._bits_count = 0
+
+    def get_bits_count(self):
+        """Returns quantity of bits written so far."""
+        return self._bits_count + self._bits_in_accumulator
+
+    def write(self, code, length):
+        """
+        Appends one code.
+
+        code - integer which lower bits are code
+        length - quantity of bits in code
+        """
+        self._accumulator = (self._accumulator << length) | code
+        self._bits_in_accumulator += length
+        if self._bits_in_accumulator >= self._FLUSH_BITS:
+            self._flush()
+
+    def write_symbols(self, symbols, codes):
+        """
+        Appends codes of all given symbols.
+
+        symbols - string or list of symbols
+        codes - dictionary with symbols and tuples (code, length)
+        """
+        # Codes of a chunk are joined as text once and turned into one
+        # integer, which is much cheaper than shifting per symbol
+        bit_strings = {}
+        for symbol, (code, length) in codes.iteritems():
+            bit_strings[symbol] = bin(code)[2:].zfill(length)
+        get_bits = bit_strings.__getitem__
+        for start in xrange(0, len(symbols), self._CHUNK_SYMBOLS):
+            bits = ''.join(map(get_bits,
+                symbols[start:start + self._CHUNK_SYMBOLS]))
+            if bits:
+                self.write(int(bits, 2), len(bits))
+
+    def get_bytes(self):
+        """Returns string with all written bits (last byte padded)."""
+        self._flush()
+        result = str(self._buffer)
+        if self._bits_in_accumulator:
+            padding = 8 - self._bits_in_accumulator
+            result += chr((self._accumulator << padding) & 0xff)
+        return result
+
+    def _flush(self):
+        """Moves whole bytes from accumulator to buffer."""
+        rest = self._bits_in_accumulator & 7
+        whole = self._bits_in_accumulator - rest
+        if not whole:
+            return
+        value = self._accumulator >> rest
+        self._buffer.extend(unhexlify('%0*x' % (whole >> 2, value)))
+        self._accumulator &= (1 << rest) - 1
+        self._bits_in_accumulator = rest
+        self._bits_count += whole
+
+
+class BitReader(object):
+    """
+    Reads codes of variable length from bytes packed by BitWriter.
+
+    data - string with packed bits
+    offset - position of first byte with bits in data
+    """
+    def __init__(self, data, offset=0):
+        super(BitReader, self).__init__()
+        self._data = data
+        self._position = offset
+        self._accumulator = 0
+        self._bits_in_accumulator = 0
+        self._bits_read = 0
+
+    def get_bits_read(self):
+        """Returns quantity of bits consumed so far."""
+        return self._bits_read
+
+    def get_bits_left(self):
+        """Returns quantity of bits not consumed yet (padding included)."""
+        return (len(self._data) - self._position) * 8 + \
+                self._bits_in_accumulator
+
+    def peek(self, length):
+        """
+        Returns next length bits as integer without consuming them. Bits
+        past the end of data are zeros.
+        """
+        if self._bits_in_accumulator < length:
+            self._fill(length)
+        return (self._accumulator >> (self._bits_in_accumulator - length)) \
+                & ((1 << length) - 1)
+
+    def skip(self, length):
+        """Consumes next length bits."""
+        if self._bits_in_accumulator < length:
+            self._fill(length)
+        self._bits_in_accumulator -= length
+        self._accumulator &= (1 << self._bits_in_accumulator) - 1
+        self._bits_read += length
+
+    def read(self, length):
+        """Returns next length bits as integer and consumes them."""
+        value = self.peek(length)
+        self.skip(length)
+        return value
+
+    def _fill(self, length):
+        """Loads bytes into accumulator until it holds length bits."""
+        data = self._data
+        while self._bits_in_accumulator < length:
+            position = self._position
+            if position + 8 <= len(data):
+                self._accumulator = (self._accumulator << 64) | \
+                        unpack_from('>Q', data, position)[0]
+                self._bits_in_accumulator += 64
+                self._position += 8
+            elif position < len(data):
+                chunk = data[position:]
+                self._accumulator = \
+                        (self._accumulator << (8 * len(chunk))) | \
+                        int(hexlify(chunk), 16)
+                self._bits_in_accumulator += 8 * len(chunk)
+                self._position = len(data)
+            else:
+                # Padding with zeros past the end of data
+                missing = length - self._bits_in_accumulator
+                self._accumulator <<= missing
+                self._bits_in_accumulator += missing
@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+
+from coding_algorithms import CanonicalHuffmanCoding, \
+        LengthLimitedHuffmanCoding, FanoCoding, AdaptiveHuffmanCoding
+from bit_io import BitWriter, BitReader
+from table_decoding import TableDecoder
+from arythmetic_coding import RangeCoding
+from frequency_models import ContextFrequencyModel
+from lz77_coding import LZ77Coding
+from block_sorting import BlockSortingCoding
+from lzw_coding import LZ78Coding, LZWCoding, RESET_WHEN_FULL, \
+        RESET_ON_RATIO_DROP, EVICT_LEAST_RECENT
+from random import Random
+from entropy_utils import count_bytes, find_information_entropy
+
+# Policies of LZW coding by their numbers stored in coded blocks
+LZW_POLICIES = (RESET_WHEN_FULL, RESET_ON_RATIO_DROP, EVICT_LEAST_RECENT)
+# Levels of compression: the lowest is the fastest one, the highest gives
+# the smallest output; codecs with default parameters are at default level
+MIN_LEVEL = 1
+MAX_LEVEL = 9
+DEFAULT_LEVEL = 6
+# Limit of lengths of Huffman's codes: codes fit main table of
+# table_decoding.TableDecoder, so every letter is decoded with one probe
+HUFFMAN_MAX_CODE_LENGTH = 12
+# Bytes of a block sampled by automatic choice of codec: quantity of
+# slices spread over the block and size of every slice
+AUTO_SAMPLE_SLICES = 4
+AUTO_SAMPLE_SIZE = 4096
+# Length of sequences of bytes which repeating shows LZ matches
+AUTO_MATCH_LENGTH = 4
+
+class BlockCodec(object):
+    """
+    Describes interface of codecs compressing blocks of bytes for
+    FileCompressionUtility. Codec may use a table (e.g. code lengths) that
+    is stored in a frame and can be reused by following frames.
+    """
+    # Number of codec stored in frames, its name and whether it uses tables
+    CODEC_ID = None
+    NAME = None
+    HAS_TABLE = False
+
+    @classmethod
+    def get_level_options(cls, level):
+        """
+        Returns dictionary of parameters of codec for level of compression
+        (empty if codec has no parameters).
+
+        level - level from MIN_LEVEL to MAX_LEVEL
+        """
+        return {}
+
+    def select_codec(self, block):
+        """
+        Returns codec which codes a block (codec itself, codecs choosing
+        one for every block return another codec).
+
+        block - string of bytes
+        """
+        return self
+
+    def get_table_namespace(self):
+        """
+        Returns hashable value telling tables of codec with its parameters
+        from tables of other codecs (see table_cache).
+        """
+        return self.NAME
+
+    def create_table(self, counts, any_block=False):
+        """
+        Returns table for a block (None if codec doesn't use tables).
+
+        counts - list of quantities of every byte value in the block (see
+            entropy_utils.count_bytes)
+        any_block - whether table must suit any other block as well
+        """
+        return None
+
+    def get_dictionary_table(self, dictionary):
+        """
+        Returns table taken from shared dictionary (None if codec can't use
+        dictionaries).
+
+        dictionary - shared_dictionary.SharedDictionary
+        """
+        return None
+
+    def serialize_table(self, table):
+        """Packs table into a string."""
+        return ''
+
+    def deserialize_table(self, data, offset=0):
+        """
+        Restores packed table. Returns the table and offset right after it.
+
+        data - string with packed table
+        offset - position of the table in data
+        """
+        return None, offset
+
+    def encode_block(self, block, table=None):
+        """
+        Codes a block and returns string of coded data.
+
+        block - string of bytes
+        table - table made by create_table (None for codecs without tables)
+        """
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def decode_block(self, data, length, table=None):
+        """
+        Restores a block from coded data.
+
+        data - string of coded data
+        length - quantity of bytes in the block
+        table - table the block was coded with
+        """
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def _create_alphabet(self, counts, any_block=False):
+        """
+        Creates alphabet of bytes with their probabilities.
+
+        counts - list of quantities of every byte value
+        any_block - whether every byte value is included (as if it was met
+            once more)
+        """
+        if any_block:
+            counts = [count + 1 for count in counts]
+        quantity_of_letters = float(sum(counts))
+        alphabet = {}
+        for value, count in enumerate(counts):
+            if count:
+                alphabet[chr(value)] = count / quantity_of_letters
+        return alphabet
+
+
+class HuffmanBlockCodec(BlockCodec):
+    """
+    Codes bytes of a block with canonical Huffman's code, table is the
+    code (stored as code lengths).
+
+    max_code_length - limit of lengths of codes (None - no limit)
+    """
+    CODEC_ID = 1
+    NAME = 'huffman'
+    HAS_TABLE = True
+
+    def __init__(self, max_code_length=HUFFMAN_MAX_CODE_LENGTH):
+        super(HuffmanBlockCodec, self).__init__()
+        self._max_code_length = max_code_length
+        self._last_table = None
+        self._last_decoder = None
+
+    def get_table_namespace(self):
+        return self.NAME, self._max_code_length
+
+    def create_table(self, counts, any_block=False):
+        alphabet = self._create_alphabet(counts, any_block)
+        if self._max_code_length is None:
+            return CanonicalHuffmanCoding(alphabet)
+        return LengthLimitedHuffmanCoding(alphabet, self._max_code_length)
+
+    def get_dictionary_table(self, dictionary):
+        return dictionary.get_huffman_table()
+
+    def serialize_table(self, table):
+        return table.serialize_code_lengths()
+
+    def deserialize_table(self, data, offset=0):
+        return CanonicalHuffmanCoding.deserialize_code_lengths(data, offset)
+
+    def encode_block(self, block, table=None):
+        writer = BitWriter()
+        writer.write_symbols(block, table.get_numeric_codes())
+        return writer.get_bytes()
+
+    def decode_block(self, data, length, table=None):
+        # Decoding tables are kept while frames share the code
+        if table is not self._last_table:
+            self._last_decoder = TableDecoder(table.get_coded_alphabet())
+            self._last_table = table
+        return self._last_decoder.decode(data, length)
+
+
+class FanoBlockCodec(HuffmanBlockCodec):
+    """
+    Codes bytes of a block with Fano's code. Any prefix code is restored
+    from its code lengths as canonical one, so table is stored like
+    Huffman's code.
+    """
+    CODEC_ID = 4
+    NAME = 'fano'
+
+    def __init__(self):
+        super(FanoBlockCodec, self).__init__(None)
+
+    def get_table_namespace(self):
+        return self.NAME
+
+    def create_table(self, counts, any_block=False):
+        alphabet = self._create_alphabet(counts, any_block)
+        return CanonicalHuffmanCoding(alphabet,
+                FanoCoding(alphabet).get_code_lengths())
+
+
+class AdaptiveHuffmanBlockCodec(BlockCodec):
+    """
+    Codes bytes of a block with adaptive Huffman's code in one pass, no
+    table is needed (see coding_algorithms.AdaptiveHuffmanCoding).
+    """
+    CODEC_ID = 7
+    NAME = 'adaptive'
+
+    def encode_block(self, block, table=None):
+        return AdaptiveHuffmanCoding().encode(block)
+
+    def decode_block(self, data, length, table=None):
+        return AdaptiveHuffmanCoding().decode(data, length)
+
+
+class ArithmeticBlockCodec(BlockCodec):
+    """
+    Codes bytes of a block with range coder and adaptive model of given
+    order (0 - probabilities of bytes, 1 - probabilities after previous
+    byte and so on), so no table is needed. Coded block starts with the
+    order.
+    """
+    CODEC_ID = 5
+    NAME = 'arith'
+
+    def __init__(self, order=1):
+        super(ArithmeticBlockCodec, self).__init__()
+        self._order = order
+
+    @classmethod
+    def get_level_options(cls, level):
+        return {'order': 0 if level < DEFAULT_LEVEL else 1}
+
+    def encode_block(self, block, table=None):
+        model = ContextFrequencyModel(range(256), self._order)
+        return chr(self._order) + RangeCoding(model).encode(bytearray(block))
+
+    def decode_block(self, data, length, table=None):
+        if not data:
+            raise ValueError("Coded block is damaged.")
+        model = ContextFrequencyModel(range(256), ord(data[0]))
+        return str(bytearray(RangeCoding(model).decode(data, length, 1)))
+
+
+class LZ78BlockCodec(BlockCodec):
+    """
+    Codes a block with LZ78 coding: every pair of a word is packed as index
+    of known word (with as many bits as needed for words known at the
+    moment) followed by the letter. Last pair of a block may have no letter.
+    """
+    CODEC_ID = 6
+    NAME = 'lz78'
+
+    def encode_block(self, block, table=None):
+        writer = BitWriter()
+        code_length = 0
+        for known_words, (index, letter) in enumerate(
+                LZ78Coding(block).get_pairs(), 1):
+            if known_words > (1 << code_length):
+                code_length += 1
+            writer.write(index, code_length)
+            if letter is not None:
+                writer.write(ord(letter), 8)
+        return writer.get_bytes()
+
+    def decode_block(self, data, length, table=None):
+        reader = BitReader(data)
+        words = ['']
+        result = []
+        restored = 0
+        code_length = 0
+        while restored < length:
+            if len(words) > (1 << code_length):
+                code_length += 1
+            if reader.get_bits_left() < code_length:
+                raise ValueError("Coded block is truncated.")
+            index = reader.read(code_length)
+            if index >= len(words):
+                raise ValueError("Unknown word in coded block.")
+            word = words[index]
+            if restored + len(word) < length:
+                if reader.get_bits_left() < 8:
+                    raise ValueError("Coded block is truncated.")
+                word += chr(reader.read(8))
+                words.append(word)
+            result.append(word)
+            restored += len(word)
+        block = ''.join(result)
+        if len(block) != length:
+            raise ValueError("Decoded block has wrong length.")
+        return block
+
+
+class LZ77BlockCodec(BlockCodec):
+    """
+    Codes a block with LZ77 coding followed by Huffman's codes (see
+    lz77_coding.LZ77Coding for parameters).
+    """
+    CODEC_ID = 2
+    NAME = 'lz77'
+
+    def __init__(self, window_size=32768, max_chain=32, lazy=True):
+        super(LZ77BlockCodec, self).__init__()
+        self._window_size = window_size
+        self._max_chain = max_chain
+        self._lazy = lazy
+
+    @classmethod
+    def get_level_options(cls, level):
+        # Candidates of a match are doubled with every level
+        return {'max_chain': 1 << (level - 1), 'lazy': level >= 4}
+
+    def encode_block(self, block, table=None):
+        # Matches are compared at random places, that's faster in a string
+        # than in a buffer of mapped file
+        return LZ77Coding(str(block), self._window_size, self._max_chain,
+                self._lazy).get_coded_string()
+
+    def decode_block(self, data, length, table=None):
+        block = LZ77Coding('').decode_string(data)
+        if len(block) != length:
+            raise ValueError("Decoded block has wrong length.")
+        return block
+
+
+class LZWBlockCodec(BlockCodec):
+    """
+    Codes a block with LZW coding (see lzw_coding.LZWCoding for
+    parameters), table is list of seed words taken from shared dictionary.
+    Coded block starts with maximal code length and number of policy.
+    """
+    CODEC_ID = 3
+    NAME = 'lzw'
+
+    def __init__(self, max_code_length=12, policy=RESET_WHEN_FULL):
+        super(LZWBlockCodec, self).__init__()
+        self._max_code_length = max_code_length
+        self._policy = policy
+
+    @classmethod
+    def get_level_options(cls, level):
+        return {'max_code_length': 9 + level // 2}
+
+    def get_dictionary_table(self, dictionary):
+        return dictionary.get_seed_words()
+
+    def encode_block(self, block, table=None):
+        coder = LZWCoding(block, self._max_code_length, self._policy,
+                seed_words=table or ())
+        return chr(self._max_code_length) + \
+                chr(LZW_POLICIES.index(self._policy)) + \
+                coder.get_coded_string()
+
+    def decode_block(self, data, length, table=None):
+        if len(data) < 2 or ord(data[1]) >= len(LZW_POLICIES):
+            raise ValueError("Coded block is damaged.")
+        coder = LZWCoding('', ord(data[0]), LZW_POLICIES[ord(data[1])],
+                seed_words=table or ())
+        block = coder.decode_string(data, 2)
+        if len(block) != length:
+            raise ValueError("Decoded block has wrong length.")
+        return block
+
+
+class BlockSortingBlockCodec(BlockCodec):
+    """
+    Codes a block with block-sorting coding: Burrows-Wheeler transform,
+    move-to-front and run-length coding followed by Huffman's code or
+    arithmetic coding (see block_sorting.BlockSortingCoding for
+    parameters). Like in bzip2, every level adds 100 KB to size of sorted
+    blocks.
+    """
+    CODEC_ID = 9
+    NAME = 'bwt'
+
+    def __init__(self, block_size=DEFAULT_LEVEL * 100000,
+            entropy_coder='huffman'):
+        super(BlockSortingBlockCodec, self).__init__()
+        self._block_size = block_size
+        self._entropy_coder = entropy_coder
+
+    @classmethod
+    def get_level_options(cls, level):
+        return {'block_size': level * 100000}
+
+    def encode_block(self, block, table=None):
+        return BlockSortingCoding(str(block), self._block_size,
+                self._entropy_coder).get_coded_string()
+
+    def decode_block(self, data, length, table=None):
+        block = BlockSortingCoding('').decode_string(data)
+        if len(block) != length:
+            raise ValueError("Decoded block has wrong length.")
+        return block
+
+
+class RawBlockCodec(BlockCodec):
+    """Stores bytes of a block as they are (for incompressible blocks)."""
+    CODEC_ID = 8
+    NAME = 'raw'
+
+    def encode_block(self, block, table=None):
+        return str(block)
+
+    def decode_block(self, data, length, table=None):
+        if len(data) != length:
+            raise ValueError("Stored block has wrong length.")
+        return data
+
+
+class AutoBlockCodec(BlockCodec):
+    """
+    Chooses codec for every block by a sample of it: order-0 entropy of
+    bytes and rate of repeated sequences (which LZ coding turns into
+    matches) above the rate met in shuffled sample, since sequences of
+    frequent bytes repeat by chance too. Repetitive blocks get LZ77
+    coding, blocks which entropy is close to 8 bits are stored raw, others
+    get Huffman's code or, if Huffman's code loses much to entropy (some
+    byte is very probable), arithmetic coding. Frames are written with
+    codec chosen, so this codec has no number.
+
+    level - level of compression of chosen codecs (None - default
+        parameters)
+    raw_entropy - entropy in bits per byte from which blocks are stored
+    match_rate - excess of part of sampled sequences seen before in the
+        sample over the part in shuffled sample from which LZ77 coding is
+        chosen
+    prefix_loss - part of entropy which Huffman's code may lose at most
+    """
+    NAME = 'auto'
+
+    def __init__(self, level=None, raw_entropy=7.5, match_rate=0.2,
+            prefix_loss=0.1):
+        super(AutoBlockCodec, self).__init__()
+        self._raw_entropy = raw_entropy
+        self._match_rate = match_rate
+        self._prefix_loss = prefix_loss
+        self._codecs = dict((name, create_codec(name, level))
+                for name in ('raw', 'huffman', 'arith', 'lz77'))
+
+    @classmethod
+    def get_level_options(cls, level):
+        return {'level': level}
+
+    def select_codec(self, block):
+        sample = self._take_sample(block)
+        if not sample:
+            return self._codecs['raw']
+        shuffled = list(sample)
+        Random(len(sample)).shuffle(shuffled)
+        if self._find_match_rate(sample) - self._find_match_rate(
+                ''.join(shuffled)) >= self._match_rate:
+            return self._codecs['lz77']
+        counts = count_bytes(sample)
+        total = float(len(sample))
+        entropy = find_information_entropy(*[count / total
+            for count in counts if count])
+        if entropy >= self._raw_entropy:
+            return self._codecs['raw']
+        # Huffman's code is longer than entropy by less than probability of
+        # the most probable byte plus 0.086 bits
+        if max(counts) / total + 0.086 > self._prefix_loss * entropy:
+            return self._codecs['arith']
+        return self._codecs['huffman']
+
+    def encode_block(self, block, table=None):
+        raise ValueError("Codec must be selected for every block.")
+
+    def decode_block(self, data, length, table=None):
+        raise ValueError("Codec must be selected for every block.")
+
+    def _take_sample(self, block):
+        """Returns a few slices spread over a block (whole small block)."""
+        if len(block) <= AUTO_SAMPLE_SLICES * AUTO_SAMPLE_SIZE:
+            return str(block)
+        step = len(block) // AUTO_SAMPLE_SLICES
+        return ''.join(str(block[start:start + AUTO_SAMPLE_SIZE])
+                for start in xrange(0, step * AUTO_SAMPLE_SLICES, step))
+
+    def _find_match_rate(self, sample):
+        """Returns part of sequences of bytes seen before in a sample."""
+        positions = len(sample) - AUTO_MATCH_LENGTH + 1
+        if positions <= 0:
+            return 0.
+        seen = set()
+        add = seen.add
+        for position in xrange(positions):
+            add(sample[position:position + AUTO_MATCH_LENGTH])
+        return 1. - float(len(seen)) / positions
+
+
+CODECS = dict((codec.NAME, codec)
+        for codec in (HuffmanBlockCodec, FanoBlockCodec,
+            AdaptiveHuffmanBlockCodec, ArithmeticBlockCodec, LZ78BlockCodec,
+            LZ77BlockCodec, LZWBlockCodec, BlockSortingBlockCodec,
+            RawBlockCodec, AutoBlockCodec))
+
+
+def create_codec(name, level=None, **options):
+    """
+    Returns codec with given name.
+
+    name - name of codec (key of CODECS)
+    level - level of compression giving parameters of codec (see
+        BlockCodec.get_level_options), default parameters if None
+    **options - parameters of codec (override ones given by level)
+    """
+    if name not in CODECS:
+        raise ValueError("Unknown codec %r." % name)
+    codec = CODECS[name]
+    if level is not None:
+        if not MIN_LEVEL <= level <= MAX_LEVEL:
+            raise ValueError("Level must be from %d to %d." %
+                    (MIN_LEVEL, MAX_LEVEL))
+        options = dict(codec.get_level_options(level), **options)
+    return codec(**options)
+
+
+def find_codec(codec_id):
+    """
+    Returns codec (with default parameters) by number stored in frames.
+
+    codec_id - number of codec
+    """
+    for codec in CODECS.itervalues():
+        if codec.CODEC_ID == codec_id:
+            return codec()
+    raise ValueError("Unknown codec number %d." % codec_id)
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+from struct import pack, unpack_from
+from coding_algorithms import CanonicalHuffmanCoding, \
+        LengthLimitedHuffmanCoding
+from arythmetic_coding import RangeCoding
+from frequency_models import AdaptiveFrequencyModel
+from bit_io import BitWriter
+from table_decoding import TableDecoder
+
+# Symbols of coded string: runs of zeros left by move-to-front are written
+# in bijective base 2 with digits RUN_A (1) and RUN_B (2), least
+# significant first, other values v are written as symbols v + 1
+RUN_A = 0
+RUN_B = 1
+SYMBOLS_COUNT = 257
+# Coders of symbols by their numbers stored in coded strings
+ENTROPY_CODERS = ('huffman', 'arith')
+# Limit of lengths of Huffman's codes (see table_decoding.TableDecoder)
+MAX_CODE_LENGTH = 12
+HEADER = '>IIB'
+
+class BlockSortingCoding(object):
+    """
+    Represents block-sorting coding (like in bzip2): string is divided
+    into blocks, every block is replaced by Burrows-Wheeler transform of it
+    (similar contexts bring equal bytes together), transformed blocks go
+    through move-to-front coding (equal bytes become zeros), runs of zeros
+    are shortened and resulting symbols are coded with Huffman's code or
+    adaptive arithmetic coding. Coded string holds length of string, size
+    of blocks, number of entropy coder, primary index of every block and
+    coded symbols.
+
+    input_string - string to be coded
+    block_size - size of sorted blocks (larger blocks need more memory,
+        but give better compression)
+    entropy_coder - coder of symbols (one of ENTROPY_CODERS)
+    """
+    def __init__(self, input_string, block_size=900000,
+            entropy_coder='huffman'):
+        super(BlockSortingCoding, self).__init__()
+        if block_size <= 0:
+            raise ValueError("Size of blocks must be positive.")
+        if entropy_coder not in ENTROPY_CODERS:
+            raise ValueError("Unknown entropy coder %r." % entropy_coder)
+        self._input_string = input_string
+        self._block_size = block_size
+        self._entropy_coder = entropy_coder
+        self._coded_string = None
+
+    def get_input_string(self):
+        """Returns current string to encode."""
+        return self._input_string
+
+    def set_input_string(self, new_string):
+        """Sets current string to encode."""
+        self._input_string = new_string
+        self._coded_string = None
+
+    def get_coded_string(self):
+        """Returns encoded string (codes it if needed)."""
+        if self._coded_string is None:
+            self._coded_string = self._encode_string(self._input_string)
+        return self._coded_string
+
+    def decode_string(self, coded_string, offset=0):
+        """
+        Restores string from coded one.
+
+        coded_string - string produced by get_coded_string
+        offset - position of coded data in coded_string
+        """
+        if len(coded_string) < offset + 9:
+            raise ValueError("Coded string is truncated.")
+        length, block_size, coder_number = unpack_from(HEADER, coded_string,
+                offset)
+        offset += 9
+        if not block_size or coder_number >= len(ENTROPY_CODERS):
+            raise ValueError("Coded string is damaged.")
+        blocks_count = (length + block_size - 1) // block_size
+        if len(coded_string) < offset + 4 * blocks_count:
+            raise ValueError("Coded string is truncated.")
+        primary_indexes = unpack_from('>%dI' % blocks_count, coded_string,
+                offset)
+        offset += 4 * blocks_count
+        if ENTROPY_CODERS[coder_number] == 'huffman':
+            symbols = self._decode_huffman(coded_string, offset)
+        else:
+            symbols = self._decode_arithmetic(coded_string, offset)
+        transformed = inverse_move_to_front(decode_zero_runs(symbols))
+        if len(transformed) != length:
+            raise ValueError("Decoded string has wrong length.")
+        blocks = []
+        for number, primary_index in enumerate(primary_indexes):
+            start = number * block_size
+            blocks.append(inverse_burrows_wheeler_transform(
+                transformed[start:start + block_size], primary_index))
+        return ''.join(blocks)
+
+    def _encode_string(self, input_string):
+        """Transforms string by blocks and codes the result."""
+        length = len(input_string)
+        primary_indexes = []
+        transformed = []
+        for start in xrange(0, length, self._block_size):
+            last_column, primary_index = burrows_wheeler_transform(
+                    input_string[start:start + self._block_size])
+            transformed.append(last_column)
+            primary_indexes.append(primary_index)
+        symbols = encode_zero_runs(move_to_front(''.join(transformed)))
+        header = pack(HEADER, length, self._block_size,
+                ENTROPY_CODERS.index(self._entropy_coder)) + \
+                pack('>%dI' % len(primary_indexes), *primary_indexes)
+        if self._entropy_coder == 'huffman':
+            return header + self._encode_huffman(symbols)
+        return header + self._encode_arithmetic(symbols)
+
+    def _encode_huffman(self, symbols):
+        """
+        Codes symbols with canonical Huffman's code: quantity of symbols,
+        code lengths (quantity of lengths up to the last coded symbol
+        followed by one length per symbol) and packed codes.
+        """
+        counts = {}
+        for symbol in symbols:
+            counts[symbol] = counts.get(symbol, 0) + 1
+        code_lengths = {}
+        writer = BitWriter()
+        if counts:
+            coder = LengthLimitedHuffmanCoding(counts, MAX_CODE_LENGTH)
+            code_lengths = coder.get_code_lengths()
+            writer.write_symbols(symbols, coder.get_numeric_codes())
+        lengths_count = max(code_lengths) + 1 if code_lengths else 0
+        return pack('>IH', len(symbols), lengths_count) + \
+                ''.join(chr(code_lengths.get(symbol, 0))
+                    for symbol in xrange(lengths_count)) + \
+                writer.get_bytes()
+
+    def _decode_huffman(self, coded_string, offset):
+        """Restores symbols coded by _encode_huffman."""
+        if len(coded_string) < offset + 6:
+            raise ValueError("Coded string is truncated.")
+        count, lengths_count = unpack_from('>IH', coded_string, offset)
+        offset += 6
+        packed = bytearray(coded_string[offset:offset + lengths_count])
+        if len(packed) != lengths_count:
+            raise ValueError("Table of code lengths is truncated.")
+        offset += lengths_count
+        if not count:
+            return []
+        code_lengths = dict((symbol, length)
+                for symbol, length in enumerate(packed) if length)
+        if not code_lengths:
+            raise ValueError("Table of code lengths is empty.")
+        coder = CanonicalHuffmanCoding(code_lengths=code_lengths)
+        return TableDecoder(coder.get_coded_alphabet()).decode(coded_string,
+                count, offset)
+
+    def _encode_arithmetic(self, symbols):
+        """
+        Codes symbols with range coder and adaptive order-0 model after
+        quantity of symbols.
+        """
+        model = AdaptiveFrequencyModel(range(SYMBOLS_COUNT))
+        return pack('>I', len(symbols)) + RangeCoding(model).encode(symbols)
+
+    def _decode_arithmetic(self, coded_string, offset):
+        """Restores symbols coded by _encode_arithmetic."""
+        if len(coded_string) < offset + 4:
+            raise ValueError("Coded string is truncated.")
+        count = unpack_from('>I', coded_string, offset)[0]
+        model = AdaptiveFrequencyModel(range(SYMBOLS_COUNT))
+        return RangeCoding(model).decode(coded_string, count, offset + 4)
+
+
+def build_suffix_array(data):
+    """
+    Returns list of positions of suffixes of a string in order of the
+    suffixes. Suffixes are sorted in linear time with SA-IS algorithm.
+
+    data - string of bytes
+    """
+    text = [value + 1 for value in bytearray(data)]
+    # Unique sentinel, it's the least suffix
+    text.append(0)
+    return _sort_suffixes(text, 257)[1:]
+
+
+def burrows_wheeler_transform(data):
+    """
+    Returns Burrows-Wheeler transform of a string: tuple (last column,
+    primary index). Rows are sorted suffixes of the string followed by
+    sentinel less than any byte, last column holds byte before every
+    suffix (without the sentinel standing before the whole string), primary
+    index is the row of the whole string.
+
+    data - string of bytes
+    """
+    values = bytearray(data)
+    text = [value + 1 for value in values]
+    text.append(0)
+    last_column = bytearray()
+    append = last_column.append
+    primary_index = 0
+    for row, position in enumerate(_sort_suffixes(text, 257)):
+        if position:
+            append(values[position - 1])
+        else:
+            primary_index = row
+    return str(last_column), primary_index
+
+
+def inverse_burrows_wheeler_transform(last_column, primary_index):
+    """
+    Restores string from its Burrows-Wheeler transform.
+
+    last_column - last column made by burrows_wheeler_transform
+    primary_index - primary index made by burrows_wheeler_transform
+    """
+    length = len(last_column)
+    if not length:
+        return ''
+    if not 0 < primary_index <= length:
+        raise ValueError("Primary index is out of range.")
+    # Column with the sentinel at its place, it's the least symbol
+    column = bytearray(last_column)
+    starts = [0] * 256
+    for value in column:
+        starts[value] += 1
+    column.insert(primary_index, 0)
+    total = 1
+    for value, count in enumerate(starts):
+        starts[value] = total
+        total += count
+    # Row of every suffix is followed by row of the next suffix: they are
+    # rows of equal bytes in the first and in the last column
+    next_rows = [primary_index] * (length + 1)
+    for row, value in enumerate(column):
+        if row != primary_index:
+            next_rows[starts[value]] = row
+            starts[value] += 1
+    result = bytearray(length)
+    row = primary_index
+    for position in xrange(length):
+        row = next_rows[row]
+        result[position] = column[row]
+    return str(result)
+
+
+def move_to_front(data):
+    """
+    Returns list of indexes of bytes of a string in list of byte values
+    where every coded byte is moved to the front.
+
+    data - string of bytes
+    """
+    table = range(256)
+    result = []
+    append = result.append
+    for value in bytearray(data):
+        if table[0] == value:
+            append(0)
+            continue
+        index = table.index(value)
+        del table[index]
+        table.insert(0, value)
+        append(index)
+    return result
+
+
+def inverse_move_to_front(indexes):
+    """
+    Restores string from indexes made by move_to_front.
+
+    indexes - list of indexes
+    """
+    table = range(256)
+    result = bytearray()
+    append = result.append
+    for index in indexes:
+        value = table[index]
+        if index:
+            del table[index]
+            table.insert(0, value)
+        append(value)
+    return str(result)
+
+
+def encode_zero_runs(values):
+    """
+    Returns list of symbols where every run of zeros is replaced by digits
+    RUN_A and RUN_B of its length, other values v are replaced by v + 1.
+
+    values - list of numbers from 0 to 255
+    """
+    symbols = []
+    append = symbols.append
+    run = 0
+    for value in values:
+        if not value:
+            run += 1
+            continue
+        while run:
+            run -= 1
+            append(run & 1)
+            run >>= 1
+        append(value + 1)
+    while run:
+        run -= 1
+        append(run & 1)
+        run >>= 1
+    return symbols
+
+
+def decode_zero_runs(symbols):
+    """
+    Restores values from symbols made by encode_zero_runs.
+
+    symbols - list of symbols
+    """
+    values = []
+    extend = values.extend
+    append = values.append
+    run = 0
+    weight = 1
+    for symbol in symbols:
+        if symbol <= RUN_B:
+            run += (symbol + 1) * weight
+            weight <<= 1
+            continue
+        if run:
+            extend([0] * run)
+            run = 0
+            weight = 1
+        if symbol >= SYMBOLS_COUNT:
+            raise ValueError("Unknown symbol %d." % symbol)
+        append(symbol - 1)
+    if run:
+        extend([0] * run)
+    return values
+
+
+def _sort_suffixes(text, alphabet_size):
+    """
+    Returns suffix array of text with SA-IS algorithm: LMS suffixes
+    (S-type suffix after L-type one, suffix is S-type if it's less than
+    the next one) are sorted by their LMS substrings, which induces order
+    of all suffixes. If some LMS substrings are equal, order of LMS
+    suffixes is found recursively for string of names of the substrings.
+
+    text - list of numbers less than alphabet_size ending with unique 0
+    alphabet_size - quantity of possible numbers
+    """
+    length = len(text)
+    if length == 1:
+        return [0]
+    s_type = [False] * length
+    s_type[-1] = True
+    for position in xrange(length - 2, -1, -1):
+        value, next_value = text[position], text[position + 1]
+        s_type[position] = value < next_value or \
+                (value == next_value and s_type[position + 1])
+    lms_positions = [position for position in xrange(1, length)
+            if s_type[position] and not s_type[position - 1]]
+    is_lms = [False] * length
+    for position in lms_positions:
+        is_lms[position] = True
+
+    counts = [0] * alphabet_size
+    for value in text:
+        counts[value] += 1
+    bucket_heads = []
+    bucket_tails = []
+    total = 0
+    for count in counts:
+        bucket_heads.append(total)
+        total += count
+        bucket_tails.append(total)
+
+    suffix_array = _induce_suffixes(text, s_type, lms_positions,
+            bucket_heads, bucket_tails)
+    # Equal LMS substrings get equal names, names follow their order
+    names = [0] * length
+    name = -1
+    previous = None
+    for position in suffix_array:
+        if not is_lms[position]:
+            continue
+        if previous is None or not _are_lms_substrings_equal(text, s_type,
+                is_lms, position, previous):
+            name += 1
+        names[position] = name
+        previous = position
+    reduced_text = [names[position] for position in lms_positions]
+    if name + 1 < len(lms_positions):
+        reduced_order = _sort_suffixes(reduced_text, name + 1)
+    else:
+        reduced_order = [0] * len(reduced_text)
+        for index, name in enumerate(reduced_text):
+            reduced_order[name] = index
+    return _induce_suffixes(text, s_type,
+            [lms_positions[index] for index in reduced_order],
+            bucket_heads, bucket_tails)
+
+
+def _induce_suffixes(text, s_type, lms_positions, bucket_heads,
+        bucket_tails):
+    """
+    Returns suffix array induced from LMS suffixes: they are put to ends of
+    their buckets, L-type suffixes are put to heads of buckets scanning
+    from the start, S-type ones are put to ends scanning from the end.
+    """
+    suffix_array = [-1] * len(text)
+    tails = list(bucket_tails)
+    for position in reversed(lms_positions):
+        value = text[position]
+        tails[value] -= 1
+        suffix_array[tails[value]] = position
+    heads = list(bucket_heads)
+    for index in xrange(len(text)):
+        position = suffix_array[index] - 1
+        if position >= 0 and not s_type[position]:
+            value = text[position]
+            suffix_array[heads[value]] = position
+            heads[value] += 1
+    tails = list(bucket_tails)
+    for index in xrange(len(text) - 1, -1, -1):
+        position = suffix_array[index] - 1
+        if position >= 0 and s_type[position]:
+            value = text[position]
+            tails[value] -= 1
+            suffix_array[tails[value]] = position
+    return suffix_array
+
+
+def _are_lms_substrings_equal(text, s_type, is_lms, first, second):
+    """Compares LMS substrings (up to the next LMS position) at positions."""
+    offset = 0
+    while True:
+        if text[first + offset] != text[second + offset] or \
+                s_type[first + offset] != s_type[second + offset]:
+            return False
+        if offset and (is_lms[first + offset] or is_lms[second + offset]):
+            return is_lms[first + offset] and is_lms[second + offset]
+        offset += 1
+
+
+if __name__ == '__main__':
+    """First argument - name of file to encode."""
+    from sys import argv
+
+    if len(argv) >= 2:
+        with open(argv[1], 'rb') as file_to_code:
+            input_string = file_to_code.read()
+    else:
+        input_string = 'abracadabra abracadabra abracadabra'
+
+    print burrows_wheeler_transform(input_string[:64])
+    for entropy_coder in ENTROPY_CODERS:
+        coder = BlockSortingCoding(input_string, entropy_coder=entropy_coder)
+        coded_string = coder.get_coded_string()
+        print entropy_coder, len(input_string), len(coded_string)
+        print coder.decode_string(coded_string) == input_string
@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*- 
 
+import heapq
+from bisect import bisect_right
 from operator import itemgetter
+from itertools import izip
 from math import fabs
 from entropy_utils import find_information_entropy
+from bit_io import BitWriter, BitReader
+from tracing import Traceable
 
-class CodingAlgorithm(object):
-    """Describes basic interface for coding algorithms."""
+class CodingAlgorithm(Traceable):
+    """
+    Describes basic interface for coding algorithms. Steps of algorithm
+    are reported to tracer if it's set (see tracing).
+    """
     def get_alphabet(self):
         """Returns current alphabet."""
         raise NotImplementedError("Should be implemented in child class.")
@@ -22,6 +30,11 @@ class CodingAlgorithm(object):
         """Returns average length of coded alphabet's symbols."""
         raise NotImplementedError("Should be implemented in child class.")
 
+    def get_code_lengths(self):
+        """Returns dictionary with letters and lengths of their codes."""
+        return dict((letter, len(code))
+                for letter, code in self.get_coded_alphabet())
+
     def _sort_alphabet(self, alphabet):
         """
         Returns alphabet sorted increasingly according to probabilities of
@@ -59,10 +72,8 @@ class FanoCoding(CodingAlgorithm):
 
     def get_coded_alphabet(self):
         if not self._coded_alphabet:
-            res = {}
-            self._code_alphabet(res,
-                    self._sort_alphabet(self._alphabet_distribution)
-                    )
+            res = self._code_alphabet(
+                    self._sort_alphabet(self._alphabet_distribution))
             res = sorted(res.iteritems())
             self._coded_alphabet = res
         return self._coded_alphabet
@@ -72,69 +83,60 @@ class FanoCoding(CodingAlgorithm):
             self._average_length = self._calculate_average_length()
         return self._average_length 
 
-    def _code_alphabet(self, result, tmp_alph):
-        """Creates compression code for alphabet acording to algorithm."""
-        left, right = self._coding_step(tmp_alph)
-        print 'Left part:'
-        print left
-        print 'Right part:'
-        print right
-        print
-        for letter in left:
-            result.setdefault(letter[0], '')
-            result[letter[0]] += '1'
-        for letter in right:
-            result.setdefault(letter[0], '')
-            result[letter[0]] += '0'
-
-        if len(left) != 1:
-            self._code_alphabet(result, left)
-        if len(right) != 1:
-            self._code_alphabet(result, right)
-
-    def _coding_step(self, tmp_alph):
+    def _code_alphabet(self, tmp_alph):
         """
-        One iteration of Fano's algorithm.
-        
+        Creates compression code for alphabet acording to algorithm. Parts
+        of alphabet are ranges of indexes in sorted list, total probability
+        of any range is found from prefix sums.
+
         tmp_alph - list of letters sorted according to probabilities
         """
-        left_tmp = []
-        right_tmp = []
-        # Sorted alphabet
-        left = []
-        right = tmp_alph[::] 
-        for i in range(len(tmp_alph)):
-            left.append(tmp_alph[i])
-            if len(right) != 0:
-                right.pop(0)
-            left_prob = self._calculate_total_probability(left)
-            right_prob = self._calculate_total_probability(right)
-            delta = right_prob - left_prob
-            if i != (len(tmp_alph) - 1):
-                left_tmp = left[::]
-                left_tmp.append(tmp_alph[i+1])
-                right_tmp = right[::]
-                if len(right_tmp) != 0:
-                    right_tmp.pop(0)
-                left_tmp_p = self._calculate_total_probability(left_tmp)
-                right_tmp_p = self._calculate_total_probability(right_tmp) 
-                delta_tmp = left_tmp_p - right_tmp_p
-                if delta_tmp > 0:
-                    if fabs(delta_tmp) > fabs(delta):
-                        break
-                    else:
-                        left = left_tmp[::]
-                        right = right_tmp[::] 
-                        break
-        return left, right
-
-    def _calculate_total_probability(self, list_of_symbols):
-        """Returns sum of probabilities of letters in alphabet."""
-        sum = 0
-        for letter in list_of_symbols:
-            sum += self._alphabet_distribution[letter[0]]
-        return sum
-        
+        if len(tmp_alph) == 1:
+            return {tmp_alph[0][0]: '0'}
+        prefix_sums = [0]
+        for letter in tmp_alph:
+            prefix_sums.append(prefix_sums[-1] + letter[1])
+        result = {}
+        # Ranges [start, end) of letters still to be divided with their code
+        stack = [(0, len(tmp_alph), '')] if tmp_alph else []
+        while stack:
+            start, end, code = stack.pop()
+            if end - start == 1:
+                result[tmp_alph[start][0]] = code
+                continue
+            middle = self._find_split(prefix_sums, start, end)
+            if self._tracer is not None:
+                self._trace('split', code=code,
+                        left=tmp_alph[start:middle],
+                        right=tmp_alph[middle:end])
+            stack.append((start, middle, code + '1'))
+            stack.append((middle, end, code + '0'))
+        return result
+
+    def _find_split(self, prefix_sums, start, end):
+        """
+        One iteration of Fano's algorithm: returns index dividing range of
+        letters into two parts with the closest total probabilities. Left
+        part is the shortest one that outweighs the right part or the one
+        letter shorter, whichever is more balanced.
+
+        prefix_sums - sums of probabilities of first letters of sorted list
+        start, end - range of letters to divide
+        """
+        # Probability of the left part grows with its length, so the first
+        # outweighing part is found by binary search (left part has at
+        # least two letters, just like it was when parts were grown one
+        # letter at a time)
+        half = (prefix_sums[start] + prefix_sums[end]) / 2.
+        middle = bisect_right(prefix_sums, half, start + 2, end)
+        left_delta = 2 * prefix_sums[middle] - prefix_sums[start] - \
+                prefix_sums[end]
+        shorter_delta = prefix_sums[start] + prefix_sums[end] - \
+                2 * prefix_sums[middle - 1]
+        if middle == end or fabs(left_delta) > fabs(shorter_delta):
+            middle -= 1
+        return middle
+
 
 class HuffmanCoding(CodingAlgorithm):
     """
@@ -167,61 +169,533 @@ class HuffmanCoding(CodingAlgorithm):
     def _code_alphabet(self):
         """Creates compression code for alphabet acording to algorithm."""
         result = {}
-        # Sorted alphabet
-        tmp_alph = self._sort_alphabet(self._alphabet_distribution)
-
-        while len(tmp_alph) >= 2:
-            # Getting symbols with smallest probabilities
-            smallest_letter = tmp_alph[0][0] 
-            smallest_letter_prob = tmp_alph[0][1]
-            second_smallest_letter = tmp_alph[1][0]  
-            second_smallest_letter_prob = tmp_alph[1][1]
-
-            # Adding code symbol to code of alphabet's letters
-            # according to algorithm
-            for letter in smallest_letter:
-                result.setdefault(letter, '')
-                if smallest_letter_prob > second_smallest_letter_prob or \
-                    (smallest_letter < second_smallest_letter and \
-                    smallest_letter_prob == second_smallest_letter_prob):
-                        result[letter] += '0'
-                else:
-                    result[letter] += '1'
-
-            for letter in second_smallest_letter:
-                result.setdefault(letter, '')
-                if smallest_letter_prob > second_smallest_letter_prob or \
-                    (smallest_letter < second_smallest_letter and \
-                    smallest_letter_prob == second_smallest_letter_prob):
-                        result[letter] += '1'
-                else:
-                    result[letter] += '0'
-
-            # Merging letters
-            new_letter = smallest_letter + second_smallest_letter
-            total_probability = smallest_letter_prob + \
-                    second_smallest_letter_prob
-            print smallest_letter + ' + ' + second_smallest_letter + ' = '\
-                    + new_letter
-            print total_probability
-            print
-
-            # Cleaning alphabet from used letters
-            tmp_alph.pop(0)
-            tmp_alph.pop(0)
-
-            # Adding merged symbol (word, actually)
-            tmp_alph.append((new_letter, total_probability))
-
-            # Sorting newly acquired alphabet
-            tmp_alph = self._sort_alphabet(dict(tmp_alph))
-
-        # Reversing acquired codes
-        for k in result.keys():
-            result[k] = result[k][::-1]
+        root = self._build_code_tree()
+        if root is None:
+            return []
+        if root.zero is None:
+            # Alphabet of a single letter still needs one bit per letter
+            return [(root.symbol, '0')]
+
+        # Walking the tree, every edge adds one code symbol
+        stack = [(root, '')]
+        while stack:
+            node, code = stack.pop()
+            if node.zero is None:
+                result[node.symbol] = code
+            else:
+                stack.append((node.one, code + '1'))
+                stack.append((node.zero, code + '0'))
 
         return sorted(result.iteritems())
 
+    def _build_code_tree(self):
+        """
+        Builds Huffman's code tree with a priority queue and returns its
+        root (None for an empty alphabet).
+
+        Subtrees are ordered by probability and then by their first letter
+        (the letter their merged name would start with), so ties are
+        broken the same way as when merging symbol names.
+        """
+        queue = [(probability, letter, _HuffmanNode(letter))
+                for letter, probability in
+                self._alphabet_distribution.iteritems()]
+        heapq.heapify(queue)
+
+        while len(queue) >= 2:
+            # Getting subtrees with smallest probabilities
+            smallest_prob, smallest_head, smallest = heapq.heappop(queue)
+            second_prob, second_head, second = heapq.heappop(queue)
+
+            # Less probable subtree gets '1', on equal probabilities
+            # subtree with smaller name gets '0'
+            if smallest_prob == second_prob:
+                node = _HuffmanNode(zero=smallest, one=second)
+            else:
+                node = _HuffmanNode(zero=second, one=smallest)
+            heapq.heappush(queue,
+                    (smallest_prob + second_prob, smallest_head, node))
+            if self._tracer is not None:
+                self._trace('merge', zero=node.zero.get_letters(),
+                        one=node.one.get_letters(),
+                        probability=smallest_prob + second_prob)
+
+        if not queue:
+            return None
+        return queue[0][2]
+
+
+class _HuffmanNode(object):
+    """
+    Node of Huffman's code tree: either a leaf with a letter or an inner
+    node with subtrees for code symbols '0' and '1'.
+    """
+    __slots__ = ('symbol', 'zero', 'one')
+
+    def __init__(self, symbol=None, zero=None, one=None):
+        self.symbol = symbol
+        self.zero = zero
+        self.one = one
+
+    def get_letters(self):
+        """Returns list of letters of leaves of subtree."""
+        letters = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.zero is None:
+                letters.append(node.symbol)
+            else:
+                stack.append(node.one)
+                stack.append(node.zero)
+        return letters
+
+
+class AdaptiveHuffmanCoding(CodingAlgorithm):
+    """
+    Represents adaptive Huffman's coding (FGK algorithm): code tree is
+    updated after every letter, so encoder and decoder doing the same
+    updates keep the same code, which is neither stored nor built from
+    frequencies known in advance. Letter met the first time is coded as
+    code of special NYT (not yet transmitted) node followed by number of
+    the letter among symbols. Swaps of nodes are reported to tracer if
+    it's set (see tracing).
+
+    Tree keeps sibling property: nodes ordered by numbers have
+    nonincreasing weights and siblings are neighbours. Letter's leaf and
+    its ancestors are incremented one by one, every node is first swapped
+    with the highest numbered node of the same weight (its leader), so
+    order is kept.
+
+    symbols - list of letters that may be coded (all bytes by default)
+    """
+    def __init__(self, symbols=None):
+        super(AdaptiveHuffmanCoding, self).__init__()
+        if symbols is None:
+            symbols = [chr(value) for value in xrange(256)]
+        self._symbols = list(symbols)
+        self._symbol_numbers = dict((letter, number)
+                for number, letter in enumerate(self._symbols))
+        self._number_length = max(1, (len(self._symbols) - 1).bit_length())
+        self._string_letters = all(
+                isinstance(letter, str) and len(letter) == 1
+                for letter in self._symbols)
+        self.reset()
+
+    def reset(self):
+        """Forgets all letters, tree consists of NYT node only."""
+        # Nodes are indexes of lists of their fields
+        self._weight = [0]
+        self._parent = [None]
+        self._zero = [None]
+        self._one = [None]
+        self._letter = [None]
+        # Nodes from the highest numbered one (root) to the lowest one
+        # (always NYT) and positions of nodes in this list
+        self._order = [0]
+        self._position = [0]
+        self._nyt = 0
+        self._leaves = {}
+
+    def get_alphabet(self):
+        return list(self._symbols)
+
+    def get_alphabet_with_probabilities(self):
+        """Returns letters met so far with their frequencies."""
+        total = float(self._weight[self._order[0]])
+        return dict((letter, self._weight[node] / total)
+                for letter, node in self._leaves.iteritems())
+
+    def get_coded_alphabet(self):
+        """Returns current codes of letters met so far."""
+        result = []
+        for letter, node in self._leaves.iteritems():
+            code, length = self._get_code(node)
+            result.append((letter, bin(code)[2:].zfill(length)
+                if length else ''))
+        return sorted(result)
+
+    def get_average_length(self):
+        """Returns average length of current codes of letters met so far."""
+        probabilities = self.get_alphabet_with_probabilities()
+        return sum(probabilities[letter] * len(code)
+                for letter, code in self.get_coded_alphabet())
+
+    def encode(self, letters):
+        """
+        Codes letters starting with empty tree and returns string of bytes.
+
+        letters - iterable of symbols
+        """
+        self.reset()
+        writer = BitWriter()
+        for letter in letters:
+            self.encode_letter(letter, writer)
+        return writer.get_bytes()
+
+    def decode(self, data, count, offset=0):
+        """
+        Decodes count letters starting with empty tree and returns them (as
+        string if letters are strings, otherwise as list).
+
+        data - string of bytes produced by encode
+        count - quantity of letters to decode
+        offset - position of coded letters in data
+        """
+        self.reset()
+        reader = BitReader(data, offset)
+        letters = [self.decode_letter(reader) for i in xrange(count)]
+        if reader.get_bits_read() > 8 * (len(data) - offset):
+            raise ValueError("Coded string is truncated.")
+        if self._string_letters:
+            return ''.join(letters)
+        return letters
+
+    def encode_letter(self, letter, writer):
+        """
+        Writes code of a letter and updates the tree, so letters may be
+        coded as they arrive.
+
+        letter - letter to code
+        writer - bit_io.BitWriter
+        """
+        node = self._leaves.get(letter)
+        if node is None:
+            if letter not in self._symbol_numbers:
+                raise ValueError("Unknown letter %r." % (letter,))
+            writer.write(*self._get_code(self._nyt))
+            writer.write(self._symbol_numbers[letter], self._number_length)
+        else:
+            writer.write(*self._get_code(node))
+        self._update(letter)
+
+    def decode_letter(self, reader):
+        """
+        Reads code of a letter, updates the tree and returns the letter.
+
+        reader - bit_io.BitReader
+        """
+        zero = self._zero
+        node = self._order[0]
+        while zero[node] is not None:
+            if reader.read(1):
+                node = self._one[node]
+            else:
+                node = zero[node]
+        if node == self._nyt:
+            number = reader.read(self._number_length)
+            if number >= len(self._symbols):
+                raise ValueError("Unknown letter number %d." % number)
+            letter = self._symbols[number]
+        else:
+            letter = self._letter[node]
+        self._update(letter)
+        return letter
+
+    def _get_code(self, node):
+        """Returns tuple (code, length) of path from root to a node."""
+        parent = self._parent
+        one = self._one
+        code = 0
+        length = 0
+        while parent[node] is not None:
+            if one[parent[node]] == node:
+                code |= 1 << length
+            length += 1
+            node = parent[node]
+        return code, length
+
+    def _update(self, letter):
+        """Increments weights of letter's leaf and its ancestors."""
+        weight = self._weight
+        parent = self._parent
+        order = self._order
+        position = self._position
+        node = self._leaves.get(letter)
+        if node is None:
+            node = self._add_leaf(letter)
+        while node is not None:
+            node_weight = weight[node]
+            first = position[node]
+            while first and weight[order[first - 1]] == node_weight:
+                first -= 1
+            leader = order[first]
+            if leader == parent[node]:
+                # Parent is incremented right after its child, so the
+                # child may only move next to it
+                leader = order[first + 1]
+            if leader != node:
+                self._swap(node, leader)
+            weight[node] += 1
+            node = parent[node]
+
+    def _add_leaf(self, letter):
+        """
+        Splits NYT node into new NYT node and leaf of a letter, returns the
+        leaf.
+        """
+        parent = self._nyt
+        leaf = self._create_node(parent, letter)
+        nyt = self._create_node(parent)
+        self._one[parent] = leaf
+        self._zero[parent] = nyt
+        self._nyt = nyt
+        self._leaves[letter] = leaf
+        return leaf
+
+    def _create_node(self, parent, letter=None):
+        """Creates node with the lowest number and returns it."""
+        node = len(self._weight)
+        self._weight.append(0)
+        self._parent.append(parent)
+        self._zero.append(None)
+        self._one.append(None)
+        self._letter.append(letter)
+        self._position.append(len(self._order))
+        self._order.append(node)
+        return node
+
+    def _swap(self, first, second):
+        """Swaps two subtrees of equal weights with their numbers."""
+        parent = self._parent
+        zero = self._zero
+        one = self._one
+        first_parent = parent[first]
+        second_parent = parent[second]
+        if first_parent == second_parent:
+            zero[first_parent], one[first_parent] = \
+                    one[first_parent], zero[first_parent]
+        else:
+            if zero[first_parent] == first:
+                zero[first_parent] = second
+            else:
+                one[first_parent] = second
+            if zero[second_parent] == second:
+                zero[second_parent] = first
+            else:
+                one[second_parent] = first
+            parent[first], parent[second] = second_parent, first_parent
+        position = self._position
+        order = self._order
+        first_position = position[first]
+        second_position = position[second]
+        order[first_position], order[second_position] = second, first
+        position[first], position[second] = second_position, first_position
+        if self._tracer is not None:
+            self._trace('swap', first=first, second=second)
+
+
+class CanonicalHuffmanCoding(CodingAlgorithm):
+    """
+    Represents canonical Huffman's code: codes are derived only from code
+    lengths of letters, so whole code can be stored as a table of lengths.
+    Codes of equal length are consecutive numbers given to letters in
+    increasing order, shorter codes precede longer ones.
+
+    symbols_probability - dictionary with letters and their probabilities
+    code_lengths - dictionary with letters and lengths of their codes
+        (computed with Huffman's algorithm if not given)
+    """
+    def __init__(self, symbols_probability=None, code_lengths=None):
+        super(CanonicalHuffmanCoding, self).__init__()
+        self._alphabet_distribution = symbols_probability
+        if code_lengths is None:
+            code_lengths = \
+                    HuffmanCoding(symbols_probability).get_code_lengths()
+        self._code_lengths = code_lengths
+        self._numeric_codes = None
+        self._coded_alphabet = None
+        self._average_length = None
+
+    def get_alphabet(self):
+        return self._code_lengths.keys()
+
+    def get_alphabet_with_probabilities(self):
+        return self._alphabet_distribution
+
+    def get_coded_alphabet(self):
+        if not self._coded_alphabet:
+            res = []
+            for letter, (code, length) in \
+                    self.get_numeric_codes().iteritems():
+                res.append((letter, bin(code)[2:].zfill(length)))
+            self._coded_alphabet = sorted(res)
+        return self._coded_alphabet
+
+    def get_average_length(self):
+        if not self._average_length:
+            self._average_length = self._calculate_average_length()
+        return self._average_length
+
+    def get_code_lengths(self):
+        return self._code_lengths
+
+    def get_numeric_codes(self):
+        """
+        Returns dictionary with letters and tuples (code, length), where
+        code is an integer holding code's bits.
+        """
+        if self._numeric_codes is None:
+            self._numeric_codes = self._assign_codes(
+                    sorted(self._code_lengths.iterkeys()))
+        return self._numeric_codes
+
+    def serialize_code_lengths(self):
+        """
+        Packs code lengths of a byte alphabet into a string: the last
+        coded byte value followed by one length (0 - no code) per byte value
+        up to it, so the table never takes more than 257 bytes.
+        """
+        lengths = [0] * 256
+        for letter, length in self._code_lengths.iteritems():
+            if not isinstance(letter, str) or len(letter) != 1:
+                raise ValueError("Only byte alphabets can be serialized.")
+            if length > 255:
+                raise ValueError("Code of %r is too long." % letter)
+            lengths[ord(letter)] = length
+        last = 0
+        for value in xrange(255, -1, -1):
+            if lengths[value]:
+                last = value
+                break
+        return chr(last) + ''.join(map(chr, lengths[:last + 1]))
+
+    @classmethod
+    def deserialize_code_lengths(cls, data, offset=0):
+        """
+        Restores code from lengths packed with serialize_code_lengths.
+        Returns the code and offset right after the table.
+
+        data - string with packed table
+        offset - position of the table in data
+        """
+        count = ord(data[offset]) + 1
+        packed = data[offset + 1:offset + 1 + count]
+        if len(packed) != count:
+            raise ValueError("Table of code lengths is truncated.")
+        code_lengths = {}
+        letters = []
+        for value, length in enumerate(bytearray(packed)):
+            if length:
+                letter = chr(value)
+                code_lengths[letter] = length
+                letters.append(letter)
+        coder = cls(code_lengths=code_lengths)
+        # Letters are already ordered, so codes are assigned in linear time
+        coder._numeric_codes = coder._assign_codes(letters)
+        return coder, offset + 1 + count
+
+    def _assign_codes(self, letters):
+        """
+        Gives canonical codes to letters according to their lengths.
+
+        letters - letters of alphabet in increasing order
+        """
+        lengths = self._code_lengths
+        max_length = max(lengths.itervalues()) if lengths else 0
+        length_count = [0] * (max_length + 1)
+        for letter in letters:
+            length_count[lengths[letter]] += 1
+        length_count[0] = 0
+
+        # First code of every length
+        next_code = [0] * (max_length + 1)
+        code = 0
+        for length in xrange(1, max_length + 1):
+            code = (code + length_count[length - 1]) << 1
+            next_code[length] = code
+            if length_count[length] > (1 << length) - code:
+                raise ValueError("Code lengths do not form a prefix code.")
+
+        codes = {}
+        for letter in letters:
+            length = lengths[letter]
+            if length:
+                codes[letter] = (next_code[length], length)
+                next_code[length] += 1
+        return codes
+
+
+class LengthLimitedHuffmanCoding(CanonicalHuffmanCoding):
+    """
+    Represents canonical code with the shortest average length among codes
+    which lengths don't exceed a limit, so decoding tables and bit
+    accumulators may have fixed width. Lengths are Huffman's ones if they
+    fit the limit, otherwise they are found with package-merge algorithm.
+
+    symbols_probability - dictionary with letters and their probabilities
+    max_code_length - the greatest length of a code
+    """
+    def __init__(self, symbols_probability, max_code_length=15):
+        if len(symbols_probability) > (1 << max_code_length):
+            raise ValueError("%d letters can't have codes of %d bits." %
+                    (len(symbols_probability), max_code_length))
+        self._max_code_length = max_code_length
+        if not symbols_probability:
+            self._unlimited_lengths = {}
+            super(LengthLimitedHuffmanCoding, self).__init__(
+                    symbols_probability, {})
+            return
+        self._unlimited_lengths = \
+                HuffmanCoding(symbols_probability).get_code_lengths()
+        code_lengths = self._unlimited_lengths
+        if max(code_lengths.values() or [0]) > max_code_length:
+            code_lengths = self._limit_code_lengths(symbols_probability,
+                    max_code_length)
+        super(LengthLimitedHuffmanCoding, self).__init__(symbols_probability,
+                code_lengths)
+
+    def get_max_code_length(self):
+        """Returns the greatest length of a code."""
+        return self._max_code_length
+
+    def get_unlimited_average_length(self):
+        """Returns average length of Huffman's code without limit."""
+        return sum(self._alphabet_distribution[letter] * length
+                for letter, length in self._unlimited_lengths.iteritems())
+
+    def get_length_cost(self):
+        """
+        Returns how many times average length exceeds one of Huffman's code
+        without limit (1 if limit costs nothing).
+        """
+        unlimited = self.get_unlimited_average_length()
+        if not unlimited:
+            return 1.
+        return self.get_average_length() / unlimited
+
+    def _limit_code_lengths(self, alphabet, max_code_length):
+        """
+        Finds code lengths with package-merge algorithm: level of every
+        code bit keeps letters (weighing their probabilities) merged with
+        packages of pairs of the deeper level, the lightest 2n - 2 items of
+        the top level are chosen. Chosen packages choose twice as many
+        items of the deeper level, every level where a letter is chosen
+        adds a bit to its code.
+        """
+        letters = [letter for letter, probability in
+                self._sort_alphabet(alphabet)]
+        leaves = [(alphabet[letter], 0) for letter in letters]
+        # Levels from the deepest one, leaves go first on equal weights
+        levels = [leaves]
+        for length in xrange(max_code_length - 1):
+            items = levels[-1]
+            packages = [(items[i][0] + items[i + 1][0], 1)
+                    for i in xrange(0, len(items) - 1, 2)]
+            levels.append(list(heapq.merge(leaves, packages)))
+        lengths = [0] * len(letters)
+        chosen = 2 * len(letters) - 2
+        for items in reversed(levels):
+            chosen_leaves = 0
+            for weight, is_package in items[:chosen]:
+                if not is_package:
+                    chosen_leaves += 1
+            # The lightest letters are chosen
+            for i in xrange(chosen_leaves):
+                lengths[i] += 1
+            chosen = 2 * (chosen - chosen_leaves)
+        return dict(izip(letters, lengths))
+
 
 if __name__ == '__main__':
     eng_alphabet = {
@@ -264,6 +738,38 @@ if __name__ == '__main__':
     print eng_coder_f.get_coded_alphabet()
     print u'Average length ' + unicode(eng_coder_f.get_average_length())
 
+    print
+    eng_coder_c = CanonicalHuffmanCoding(eng_alphabet)
+    print u'Canonical Huffman:'
+    print eng_coder_c.get_coded_alphabet()
+    print u'Size of table ' + \
+            unicode(len(eng_coder_c.serialize_code_lengths()))
+
+    print
+    adaptive_coder = AdaptiveHuffmanCoding(sorted(eng_alphabet))
+    message = 'adaptivehuffmancodingneedsnotable'
+    coded_message = adaptive_coder.encode(message)
+    print u'Adaptive Huffman:'
+    print adaptive_coder.get_coded_alphabet()
+    print u'Bits per letter ' + unicode(8. * len(coded_message) / len(message))
+    print adaptive_coder.decode(coded_message, len(message))
+
+    print
+    # Probabilities like Fibonacci numbers give the longest Huffman's codes
+    skewed_alphabet = {}
+    previous, current = 1, 1
+    for letter in 'abcdefghijklmnopqrstuvwxyz':
+        skewed_alphabet[letter] = current
+        previous, current = current, previous + current
+    total = float(sum(skewed_alphabet.itervalues()))
+    for letter in skewed_alphabet:
+        skewed_alphabet[letter] /= total
+    limited_coder = LengthLimitedHuffmanCoding(skewed_alphabet, 8)
+    print u'Huffman limited to 8 bits:'
+    print limited_coder.get_coded_alphabet()
+    print u'Average length ' + unicode(limited_coder.get_average_length()) + \
+            u', cost of limit ' + unicode(limited_coder.get_length_cost())
+
     print
     print u'Entropy ' + unicode(find_information_entropy(
         0.08167,
@@ -0,0 +1,547 @@
+# -*- coding: utf-8 -*-
+
+import json
+import socket
+import logging
+from struct import pack, unpack, calcsize
+from threading import Thread, Event, Lock, BoundedSemaphore
+from Queue import Queue, Empty
+from collections import deque
+from multiprocessing import Pool, cpu_count
+from cStringIO import StringIO
+from time import time
+from SocketServer import ThreadingTCPServer, StreamRequestHandler
+from compressor import FileCompressionUtility, SeekIndex, \
+        STREAM_SIGNATURE, DEFAULT_BLOCK_SIZE
+from block_codecs import create_codec
+from table_cache import get_shared_cache
+
+# Kinds of requests: compression and restoring of whole payloads (results
+# are complete compressed files), coding of a block into a frame and
+# restoring of a frame (used by CompressingWriter and DecompressingReader)
+COMPRESS = 'compress'
+DECOMPRESS = 'decompress'
+COMPOSE_FRAME = 'frame'
+RESTORE_FRAME = 'restore'
+# Header of request and response of server: kind of request ('c' or 'd')
+# or status of response ('k' or 'e' followed by message of error) and
+# length of payload
+MESSAGE_HEADER = '>cI'
+SERVER_KINDS = {'c': COMPRESS, 'd': DECOMPRESS}
+DEFAULT_ADDRESS = ('127.0.0.1', 8765)
+
+logger = logging.getLogger(__name__)
+
+class CompressionService(object):
+    """
+    Compresses and restores many small payloads for callers that mustn't
+    be blocked (e.g. threads serving requests). Requests wait in a bounded
+    queue, so callers are slowed down when service can't keep up. They are
+    gathered into batches by a dispatching thread, every batch is one task
+    of a pool of processes, which spares coding from GIL and spreads cost
+    of passing data between processes over many payloads. Only a few
+    batches per process are handed to the pool at once.
+
+    Results are PendingResult objects, callers either wait for them or
+    get a callback. Results are passed to requests by a finishing thread
+    of the service, which waits for batches in order they were handed to
+    the pool, so callbacks never run in threads of the pool and errors
+    raised by them are only logged.
+
+    codec - name of codec (see block_codecs)
+    level - level of compression (None - default parameters of codec)
+    processes - quantity of processes (number of CPUs by default)
+    max_pending - quantity of requests waiting in queue
+    max_batch - quantity of requests in a batch
+    max_batch_bytes - quantity of bytes of payloads in a batch
+    batch_delay - seconds a batch waits for more requests
+    block_size - size of blocks of compressed payloads
+    cache_tables - whether processes reuse tables for payloads with similar
+        distributions of bytes (see table_cache)
+    """
+    def __init__(self, codec='huffman', level=None, processes=None,
+            max_pending=1024, max_batch=64, max_batch_bytes=1 << 20,
+            batch_delay=0.002, block_size=DEFAULT_BLOCK_SIZE,
+            cache_tables=True):
+        super(CompressionService, self).__init__()
+        if processes is None:
+            processes = cpu_count()
+        self._codec = create_codec(codec, level)
+        self._max_batch = max_batch
+        self._max_batch_bytes = max_batch_bytes
+        self._batch_delay = batch_delay
+        self._block_size = block_size
+        self._cache_tables = cache_tables
+        self._queue = Queue(max_pending)
+        self._batches = BoundedSemaphore(2 * processes)
+        self._pool = Pool(processes)
+        # Batches handed to pool as tuples (requests, AsyncResult)
+        self._running = Queue()
+        self._closed = False
+        self._dispatcher = Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+        self._finisher = Thread(target=self._finish_batches)
+        self._finisher.daemon = True
+        self._finisher.start()
+
+    def submit(self, kind, payload, callback=None, timeout=None):
+        """
+        Queues a request and returns its PendingResult. Waits while queue
+        is full (raises Queue.Full if it's still full after timeout).
+
+        kind - kind of request (COMPRESS, DECOMPRESS, COMPOSE_FRAME or
+            RESTORE_FRAME)
+        payload - string of bytes (frame yielded by
+            FileCompressionUtility.read_frames for RESTORE_FRAME)
+        callback - function called with the result when it's ready
+        timeout - seconds to wait for place in queue (None - no limit)
+        """
+        if self._closed:
+            raise ValueError("Service is closed.")
+        result = PendingResult(kind, payload, callback)
+        self._queue.put(result, timeout=timeout)
+        return result
+
+    def compress(self, data, callback=None):
+        """Queues compression of a payload, returns PendingResult."""
+        return self.submit(COMPRESS, data, callback)
+
+    def decompress(self, data, callback=None):
+        """Queues restoring of a compressed payload, returns PendingResult."""
+        return self.submit(DECOMPRESS, data, callback)
+
+    def close(self):
+        """Finishes queued requests and stops processes."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._running.put(None)
+        self._finisher.join()
+        self._pool.close()
+        self._pool.join()
+
+    def _dispatch(self):
+        """Gathers queued requests into batches and hands them to pool."""
+        closing = False
+        while not closing:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            size = request.get_size()
+            deadline = time() + self._batch_delay
+            while len(batch) < self._max_batch and \
+                    size < self._max_batch_bytes:
+                try:
+                    request = self._queue.get(
+                            timeout=max(deadline - time(), 0.0001))
+                except Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+                size += request.get_size()
+            self._batches.acquire()
+            task = (self._codec, self._block_size, self._cache_tables,
+                    [(request.get_kind(), request.get_payload())
+                        for request in batch])
+            self._running.put((batch,
+                self._pool.apply_async(_run_batch_in_process, (task,))))
+
+    def _finish_batches(self):
+        """
+        Waits for batches handed to pool and passes their results to their
+        requests. If the whole batch failed, all its requests get the error.
+        """
+        while True:
+            running = self._running.get()
+            if running is None:
+                break
+            batch, async_result = running
+            try:
+                results = async_result.get()
+            except Exception as error:
+                results = [(str(error) or repr(error), None)] * len(batch)
+            finally:
+                self._batches.release()
+            for request, (error, value) in zip(batch, results):
+                request._finish(error, value)
+
+
+class PendingResult(object):
+    """
+    Represents result of a request to CompressionService that may be not
+    ready yet.
+
+    kind - kind of request
+    payload - payload of request
+    callback - function called with this object when result is ready
+    """
+    def __init__(self, kind, payload, callback=None):
+        super(PendingResult, self).__init__()
+        self._kind = kind
+        self._payload = payload
+        self._callback = callback
+        self._ready = Event()
+        self._error = None
+        self._value = None
+
+    def get_kind(self):
+        """Returns kind of request."""
+        return self._kind
+
+    def get_payload(self):
+        """Returns payload of request."""
+        return self._payload
+
+    def get_size(self):
+        """Returns quantity of bytes of payload."""
+        if self._kind == RESTORE_FRAME:
+            return len(self._payload[3])
+        return len(self._payload)
+
+    def is_ready(self):
+        """Returns whether result is ready."""
+        return self._ready.is_set()
+
+    def get(self, timeout=None):
+        """
+        Waits for result and returns it, raises ValueError if request
+        failed.
+
+        timeout - seconds to wait (None - no limit)
+        """
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Result isn't ready.")
+        if self._error is not None:
+            raise ValueError(self._error)
+        return self._value
+
+    def _finish(self, error, value):
+        """Sets result (or message of error) and calls callback."""
+        self._error = error
+        self._value = value
+        self._payload = None
+        self._ready.set()
+        if self._callback is not None:
+            try:
+                self._callback(self)
+            except Exception:
+                logger.exception("Callback of %s request failed.",
+                        self._kind)
+
+
+class CompressingWriter(object):
+    """
+    File-like object writing compressed file: written data is cut into
+    blocks, which are coded into frames by service while more data is
+    written. Frames are written in order of blocks, only a few of them
+    wait for coding at once. File is complete after close.
+
+    service - CompressionService
+    target - opened file to write to
+    block_size - quantity of bytes in a block
+    max_pending - quantity of blocks being coded at once
+    """
+    def __init__(self, service, target, block_size=DEFAULT_BLOCK_SIZE,
+            max_pending=8):
+        super(CompressingWriter, self).__init__()
+        self._service = service
+        self._target = target
+        self._block_size = block_size
+        self._max_pending = max_pending
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._index = SeekIndex()
+        self._closed = False
+        target.write(STREAM_SIGNATURE)
+
+    def write(self, data):
+        """Writes data to be compressed."""
+        if self._closed:
+            raise ValueError("Writer is closed.")
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._block_size:
+            data = ''.join(self._buffer)
+            end = len(data) - len(data) % self._block_size
+            for start in xrange(0, end, self._block_size):
+                self._submit(data[start:start + self._block_size])
+            self._buffer = [data[end:]]
+            self._buffered = len(data) - end
+
+    def close(self):
+        """Compresses the rest of data and writes end of file."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._buffered:
+            self._submit(''.join(self._buffer))
+        self._buffer = []
+        while self._pending:
+            self._write_frame(self._pending.popleft().get())
+        self._target.write(self._index.pack())
+
+    def _submit(self, block):
+        """Queues coding of a block, writes frames which are waited for."""
+        self._pending.append(self._service.submit(COMPOSE_FRAME, block))
+        while len(self._pending) > self._max_pending:
+            self._write_frame(self._pending.popleft().get())
+
+    def _write_frame(self, frame):
+        self._index.add(frame)
+        self._target.write(frame)
+
+
+class DecompressingReader(object):
+    """
+    File-like object reading restored data of compressed file: frames are
+    read ahead and restored by service while restored blocks are read.
+
+    service - CompressionService
+    source - opened compressed file (written by blocks)
+    max_pending - quantity of frames being restored at once
+    """
+    def __init__(self, service, source, max_pending=8):
+        super(DecompressingReader, self).__init__()
+        self._service = service
+        self._frames = FileCompressionUtility(None).read_frames(source)
+        self._max_pending = max_pending
+        self._pending = deque()
+        self._block = ''
+        self._position = 0
+
+    def read(self, size=-1):
+        """
+        Returns up to size restored bytes (all of them if size is negative),
+        empty string at the end of file.
+        """
+        parts = []
+        while size < 0 or size > 0:
+            if self._position == len(self._block) and not self._next_block():
+                break
+            end = len(self._block)
+            if size >= 0:
+                end = min(end, self._position + size)
+                size -= end - self._position
+            parts.append(self._block[self._position:end])
+            self._position = end
+        return ''.join(parts)
+
+    def _next_block(self):
+        """Takes next restored block, returns False at the end of file."""
+        for frame in self._frames:
+            self._pending.append(self._service.submit(RESTORE_FRAME, frame))
+            if len(self._pending) >= self._max_pending:
+                break
+        if not self._pending:
+            return False
+        self._block = self._pending.popleft().get()
+        self._position = 0
+        return True
+
+
+class CompressionRequestHandler(StreamRequestHandler):
+    """
+    Serves requests of a connection to CompressionServer one by one: every
+    request and response is MESSAGE_HEADER followed by payload.
+    """
+    def handle(self):
+        service = self.server.service
+        header_size = calcsize(MESSAGE_HEADER)
+        while True:
+            header = self.rfile.read(header_size)
+            if len(header) != header_size:
+                break
+            kind, length = unpack(MESSAGE_HEADER, header)
+            payload = self.rfile.read(length)
+            if len(payload) != length or kind not in SERVER_KINDS:
+                break
+            try:
+                status = 'k'
+                response = service.submit(SERVER_KINDS[kind], payload).get()
+            except ValueError as error:
+                status = 'e'
+                response = str(error)
+            self.wfile.write(pack(MESSAGE_HEADER, status, len(response)) +
+                    response)
+
+
+class CompressionServer(ThreadingTCPServer):
+    """
+    TCP server compressing and restoring payloads with CompressionService
+    (stand-in of a serving tier for load testing), every connection is
+    served by its own thread.
+
+    address - tuple (host, port)
+    service - CompressionService
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        ThreadingTCPServer.__init__(self, address, CompressionRequestHandler)
+        self.service = service
+
+
+def send_request(connection, kind, payload):
+    """
+    Sends request to CompressionServer and returns payload of response
+    (raises ValueError if request failed).
+
+    connection - connected socket
+    kind - 'c' to compress payload or 'd' to restore it
+    payload - string of bytes
+    """
+    connection.sendall(pack(MESSAGE_HEADER, kind, len(payload)) + payload)
+    status, length = unpack(MESSAGE_HEADER,
+            _receive(connection, calcsize(MESSAGE_HEADER)))
+    response = _receive(connection, length)
+    if status != 'k':
+        raise ValueError(response)
+    return response
+
+
+def run_load_test(address, payloads, connections=8):
+    """
+    Compresses and restores payloads through CompressionServer with many
+    connections at once. Returns dictionary of results.
+
+    address - tuple (host, port) of server
+    payloads - list of strings
+    connections - quantity of connections (each one has its own thread)
+    """
+    latencies = []
+    errors = []
+    lock = Lock()
+    def run(payloads):
+        connection = socket.create_connection(address)
+        try:
+            for payload in payloads:
+                started = time()
+                try:
+                    restored = send_request(connection, 'd',
+                            send_request(connection, 'c', payload))
+                    if restored != payload:
+                        raise ValueError("Restored payload differs.")
+                except ValueError as error:
+                    with lock:
+                        errors.append(str(error))
+                with lock:
+                    latencies.append(time() - started)
+        finally:
+            connection.close()
+    threads = [Thread(target=run, args=(payloads[i::connections],))
+            for i in xrange(connections)]
+    started = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time() - started
+    latencies.sort()
+    return {
+            'requests': 2 * len(payloads),
+            'connections': connections,
+            'seconds': elapsed,
+            'requests_per_second': 2 * len(payloads) / elapsed,
+            'mb_s': sum(len(payload) for payload in payloads) / 1e6 / elapsed,
+            'median_roundtrip_ms': 1000 * latencies[len(latencies) // 2]
+                if latencies else None,
+            'errors': len(errors),
+            }
+
+
+def _receive(connection, length):
+    """Receives exactly length bytes from socket."""
+    parts = []
+    while length:
+        part = connection.recv(min(length, 1 << 16))
+        if not part:
+            raise ValueError("Connection is closed.")
+        parts.append(part)
+        length -= len(part)
+    return ''.join(parts)
+
+
+def _run_batch_in_process(task):
+    """
+    Serves a batch of requests in a process of a pool. Returns list of
+    tuples (message of error or None, result) in order of requests.
+
+    task - tuple (codec, size of blocks, whether tables are cached, list
+        of tuples (kind of request, payload))
+    """
+    codec, block_size, cache_tables, requests = task
+    table_cache = get_shared_cache() if cache_tables else None
+    results = []
+    for kind, payload in requests:
+        try:
+            utility = FileCompressionUtility(None, codec,
+                    table_cache=table_cache)
+            if kind == COMPOSE_FRAME:
+                result = utility.compose_frame(payload)
+            elif kind == RESTORE_FRAME:
+                result = utility.restore_frame(payload)
+            else:
+                output = StringIO()
+                utility.set_filename(StringIO(payload))
+                if kind == COMPRESS:
+                    utility.compress_stream(output, block_size)
+                else:
+                    utility.decompress(output)
+                result = output.getvalue()
+            results.append((None, result))
+        except Exception as error:
+            # Error of one request mustn't fail others of its batch
+            results.append((str(error) or error.__class__.__name__, None))
+    return results
+
+
+if __name__ == '__main__':
+    """Runs server or load test, run with --help to see options."""
+    from argparse import ArgumentParser
+    from random import Random
+    from benchmark import CORPORA
+
+    parser = ArgumentParser(description='Compression server for load '
+            'testing.')
+    parser.add_argument('mode', choices=('serve', 'load'),
+            help='run server or load test against it')
+    parser.add_argument('--host', default=DEFAULT_ADDRESS[0])
+    parser.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument('--codec', default='huffman',
+            help='codec of server')
+    parser.add_argument('--processes', type=int,
+            help='quantity of processes of server')
+    parser.add_argument('--requests', type=int, default=1000,
+            help='quantity of payloads of load test')
+    parser.add_argument('--size', type=int, default=2048,
+            help='size of payloads of load test')
+    parser.add_argument('--corpus', choices=sorted(CORPORA), default='text',
+            help='generator of payloads of load test')
+    parser.add_argument('--connections', type=int, default=8,
+            help='quantity of connections of load test')
+    arguments = parser.parse_args()
+
+    address = (arguments.host, arguments.port)
+    if arguments.mode == 'serve':
+        service = CompressionService(arguments.codec,
+                processes=arguments.processes)
+        server = CompressionServer(address, service)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            service.close()
+    else:
+        generate = CORPORA[arguments.corpus]
+        payloads = [generate(arguments.size, Random(i))
+                for i in xrange(arguments.requests)]
+        print json.dumps(run_load_test(address, payloads,
+            arguments.connections), indent=2, sort_keys=True)
@@ -1,15 +1,107 @@
 # -*- coding: utf-8 -*-
 
-from coding_algorithms import HuffmanCoding
+import os
+import mmap
+from stat import S_ISREG
+from struct import pack, unpack, unpack_from, calcsize
+from zlib import crc32
+from bisect import bisect_right
+from itertools import izip
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count
+from time import time
+from cStringIO import StringIO
+from coding_algorithms import CanonicalHuffmanCoding
+from table_decoding import TableDecoder
+from entropy_utils import count_bytes
+from block_codecs import HuffmanBlockCodec, RawBlockCodec, create_codec, \
+        find_codec
+from shared_dictionary import find_dictionary
+from tracing import Traceable, RecordingTracer
 
-class FileCompressionUtility(object):
+# First bytes of compressed file
+STREAM_SIGNATURE = 'CTF\x04'
+# Header of a frame: number of codec, length of block, length of frame's
+# data, flags and CRC32 of the preceding fields and data
+FRAME_HEADER = '>BIIBI'
+# Entry of seek index: offset of a frame, offset of its block in initial
+# file and offset of the frame with its table (the frame itself if it
+# needs no other frame)
+INDEX_ENTRY = '>QQQ'
+# Last bytes of compressed file: offset of seek index, quantity of its
+# entries, CRC32 of entries and signature of index
+INDEX_TRAILER = '>QII4s'
+INDEX_SIGNATURE = 'CTFX'
+# Quantity of frames checked by a process of a pool at once
+VERIFIED_FRAMES_PER_TASK = 64
+# Flag of a frame which data starts with its own table
+FRAME_WITH_TABLE = 1
+# Flag of a frame which data starts with number of shared dictionary
+# ('>I'), the dictionary gives table of the frame
+FRAME_WITH_DICTIONARY = 2
+DEFAULT_BLOCK_SIZE = 1 << 20
+# How much weight of byte values met in a block exceeds weight of values
+# met only in other blocks sharing a cached table
+CACHED_TABLE_SCALE = 1 << 10
+# First bytes of files written by earlier versions: whole file coded with
+# Huffman's code, Huffman's code by blocks (frames had no codec number) and
+# codecs by blocks (frames had no checksums, file had no index)
+SIGNATURE = 'CTF\x01'
+HUFFMAN_STREAM_SIGNATURE = 'CTF\x02'
+HUFFMAN_FRAME_HEADER = '>IIB'
+CODEC_STREAM_SIGNATURE = 'CTF\x03'
+CODEC_FRAME_HEADER = '>BIIB'
+# Signatures of files consisting of frames
+FRAMED_SIGNATURES = (STREAM_SIGNATURE, CODEC_STREAM_SIGNATURE,
+        HUFFMAN_STREAM_SIGNATURE)
+
+class FileCompressionUtility(Traceable):
     """
     Class that compresses the file using different coding algorithms.
 
-    _filename - name of a file to compress
+    Compressed file consists of signature and frames, one per block of
+    initial file, ended by frame of empty block and seek index. Frame has
+    a header (see FRAME_HEADER) and data: codec's table (if frame has its
+    own one) followed by coded bytes of the block. Frames without table
+    use table of the last frame that has it. Checksum of every frame is
+    checked as soon as frame is read, so damaged file is rejected before
+    its frame is decoded. Seek index (see INDEX_ENTRY and INDEX_TRAILER)
+    lets a part of initial file be restored without decoding other frames
+    and lets frames be verified in parallel; it's written after all frames,
+    so files are still written and read sequentially.
+
+    If tracer is set (see tracing), timings of stages of every block
+    ('select' if codec is chosen for every block, 'histogram', 'table',
+    'encode', 'write' when compressing and 'read', 'table', 'decode',
+    'write' when restoring) with quantities of bytes are reported to it,
+    as well as stage 'total' for the whole file.
+
+    Tables may be taken from a cache (see table_cache), then blocks with
+    similar distributions of bytes (e.g. many small similar files) reuse
+    a table instead of building it. Processes of a pool don't use it.
+
+    If shared dictionary is set (see shared_dictionary) and codec can use
+    it, frames refer to the dictionary instead of having tables. Files
+    referring to other dictionaries are restored with dictionaries
+    installed in dictionary path.
+
+    Files may be given by names or as opened files (e.g. sys.stdin and
+    sys.stdout), opened files are read and written only sequentially.
+
+    _filename - name of a file to compress (or opened file)
+    _codec - codec for blocks (see block_codecs)
+    _tracer - tracer receiving timings (None - no tracing)
+    _table_cache - cache of tables (None - every table is built)
+    _dictionary - shared dictionary (None - tables are stored in frames)
     """
-    def __init__(self, filename):
+    def __init__(self, filename, codec='huffman', tracer=None,
+            table_cache=None, dictionary=None):
         self._filename = filename
+        self.set_codec(codec)
+        self.set_tracer(tracer)
+        self.set_table_cache(table_cache)
+        self.set_dictionary(dictionary)
 
     def get_filename(self):
         """Getter of a filename."""
@@ -19,70 +111,849 @@ class FileCompressionUtility(object):
         """Setter of a filename."""
         self._filename = new_filename
 
-    def compress(self):
-        """Makes compressed copy of a file."""
-        self._write_string(self._compose_compressed_strings(self._filename))
+    def get_codec(self):
+        """Getter of a codec."""
+        return self._codec
+
+    def set_codec(self, new_codec):
+        """
+        Setter of a codec.
+
+        new_codec - name of codec or codec itself
+        """
+        if isinstance(new_codec, basestring):
+            new_codec = create_codec(new_codec)
+        self._codec = new_codec
+
+    def get_table_cache(self):
+        """Getter of a cache of tables."""
+        return self._table_cache
+
+    def set_table_cache(self, new_cache):
+        """Setter of a cache of tables (None turns caching off)."""
+        self._table_cache = new_cache
+
+    def get_dictionary(self):
+        """Getter of a shared dictionary."""
+        return self._dictionary
+
+    def set_dictionary(self, new_dictionary):
+        """Setter of a shared dictionary (None turns it off)."""
+        self._dictionary = new_dictionary
+        self._dictionaries = {}
+        if new_dictionary is not None:
+            self._dictionaries[new_dictionary.get_id()] = new_dictionary
+
+    def compress(self, output_filename=None):
+        """
+        Makes compressed copy of a file.
+
+        output_filename - name of compressed file or opened file (name of
+            a file with 'ctf' extension by default)
+        """
+        # Lengths of frames are 32-bit, so even the whole file in one
+        # frame would be limited to 4 GB
+        self.compress_stream(output_filename, DEFAULT_BLOCK_SIZE)
+
+    def compress_stream(self, output_filename=None,
+            block_size=DEFAULT_BLOCK_SIZE, block_tables=True):
+        """
+        Makes compressed copy of a file reading it by blocks of fixed size,
+        every block is written as a frame as soon as it's coded. Memory
+        used doesn't depend on size of a file. Regular files are mapped to
+        memory, so blocks are coded right from pages of the file without
+        being copied.
+
+        output_filename - name of compressed file or opened file (name of
+            a file with 'ctf' extension by default)
+        block_size - quantity of bytes in a block (None - whole file)
+        block_tables - whether every block gets its own table (otherwise
+            table built for the first block is used for all of them),
+            ignored when table is taken from shared dictionary
+        """
+        if output_filename is None:
+            output_filename = self._get_compressed_filename()
+        started = time()
+        table = None
+        bytes_read = 0
+        # Codec chosen for every block has no table to share
+        if self._get_dictionary_table() is not None or \
+                self._codec.CODEC_ID is None:
+            block_tables = True
+        index = SeekIndex()
+        with _open_file(self._filename, 'rb') as file_to_compress:
+            with _open_file(output_filename, 'wb') as file_to_write:
+                file_to_write.write(STREAM_SIGNATURE)
+                for block in self._map_blocks(file_to_compress, block_size):
+                    bytes_read += len(block)
+                    if block_tables:
+                        frame = self._compose_frame(block)
+                    elif table is None:
+                        table = self._create_table(block, True)
+                        frame = self._compose_frame(block, table, True)
+                    else:
+                        frame = self._compose_frame(block, table, False)
+                    index.add(frame)
+                    self._write_frame(file_to_write, frame)
+                file_to_write.write(index.pack())
+                if self._tracer is not None:
+                    self._trace_stage('total', started, bytes_read,
+                            _tell(file_to_write))
+
+    def compress_parallel(self, output_filename=None,
+            block_size=DEFAULT_BLOCK_SIZE, processes=None):
+        """
+        Makes compressed copy of a file like compress_stream, but blocks
+        (each with its own table) are coded by a pool of processes. Frames
+        are written in order of blocks, only a few blocks per process are
+        kept in memory at once. Processes map blocks of regular files to
+        memory themselves, so blocks aren't passed to them.
+
+        output_filename - name of compressed file or opened file (name of
+            a file with 'ctf' extension by default)
+        block_size - quantity of bytes in a block
+        processes - quantity of processes (number of CPUs by default)
+        """
+        if output_filename is None:
+            output_filename = self._get_compressed_filename()
+        started = time()
+        traced = self._tracer is not None
+        index = SeekIndex()
+        with _open_file(self._filename, 'rb') as file_to_compress:
+            with _open_file(output_filename, 'wb') as file_to_write:
+                file_to_write.write(STREAM_SIGNATURE)
+                tasks = ((self._codec, block, traced, self._dictionary)
+                        for block in self._locate_blocks(file_to_compress,
+                            block_size))
+                def write(result):
+                    frame, stages = result
+                    self._report_stages(stages)
+                    index.add(frame)
+                    self._write_frame(file_to_write, frame)
+                self._run_in_pool(_compose_frame_in_process,
+                        tasks, write, processes)
+                file_to_write.write(index.pack())
+                if traced:
+                    self._trace_stage('total', started,
+                            index.get_initial_size(), _tell(file_to_write))
+
+    def decompress(self, output_filename=None):
+        """
+        Restores initial file from a compressed one.
+
+        output_filename - name of restored file or opened file (name of a
+            file without extension by default)
+        """
+        if output_filename is None:
+            output_filename = self._get_restored_filename()
+        started = time()
+        with _open_file(self._filename, 'rb') as file_to_decompress:
+            signature = file_to_decompress.read(len(STREAM_SIGNATURE))
+            with _open_file(output_filename, 'wb') as file_to_write:
+                if signature in FRAMED_SIGNATURES:
+                    self._decode_stream(self._read_frames(file_to_decompress,
+                        signature), file_to_write)
+                else:
+                    file_to_write.write(self._decode_contents(
+                        signature + file_to_decompress.read()))
+                if self._tracer is not None:
+                    self._trace_stage('total', started,
+                            _tell(file_to_decompress), _tell(file_to_write))
+
+    def decompress_parallel(self, output_filename=None, processes=None):
+        """
+        Restores initial file from a compressed one, frames of file
+        compressed by blocks are decoded by a pool of processes.
+
+        output_filename - name of restored file or opened file (name of a
+            file without extension by default)
+        processes - quantity of processes (number of CPUs by default)
+        """
+        if output_filename is None:
+            output_filename = self._get_restored_filename()
+        started = time()
+        traced = self._tracer is not None
+        with _open_file(self._filename, 'rb') as file_to_decompress:
+            signature = file_to_decompress.read(len(STREAM_SIGNATURE))
+            with _open_file(output_filename, 'wb') as file_to_write:
+                if signature not in FRAMED_SIGNATURES:
+                    file_to_write.write(self._decode_contents(
+                        signature + file_to_decompress.read()))
+                else:
+                    tasks = ((frame, traced, self._dictionary) for frame in
+                            self._read_frames(file_to_decompress, signature))
+                    def write(result):
+                        block, stages = result
+                        self._report_stages(stages)
+                        self._write_frame(file_to_write, block)
+                    self._run_in_pool(_restore_block_in_process, tasks,
+                            write, processes)
+                if traced:
+                    self._trace_stage('total', started,
+                            _tell(file_to_decompress), _tell(file_to_write))
+
+    def decompress_range(self, start, length):
+        """
+        Restores a part of initial file and returns it. Only frames holding
+        the part (and frames with their tables) are read and decoded, they
+        are found by seek index, so file must allow seeking.
+
+        start - offset of the part in initial file
+        length - quantity of bytes in the part (fewer are returned if file
+            ends earlier)
+        """
+        with _open_file(self._filename, 'rb') as file_to_decompress:
+            entries = self._read_index(file_to_decompress)
+            first = max(0, bisect_right([entry[1] for entry in entries],
+                start) - 1)
+            selected = []
+            for entry in entries[first:]:
+                if entry[1] >= start + length:
+                    break
+                selected.append(entry)
+            if not length or not selected:
+                return ''
+            # Frames with tables precede frames using them
+            offsets = sorted(set(entry[0] for entry in selected) |
+                    set(entry[2] for entry in selected))
+            selected_offsets = set(entry[0] for entry in selected)
+            frames = self._read_frames(file_to_decompress, STREAM_SIGNATURE,
+                    offsets)
+            restored = StringIO()
+            self._decode_stream((frame for offset, frame in izip(offsets,
+                frames) if offset in selected_offsets), restored)
+            skipped = start - selected[0][1]
+            return restored.getvalue()[skipped:skipped + length]
+
+    def verify(self, processes=1):
+        """
+        Checks checksums of all frames without decoding them. Raises
+        ValueError if compressed file is damaged, returns quantity of
+        frames otherwise.
+
+        processes - quantity of processes checking frames (None - number
+            of CPUs), frames of named file are found by seek index then
+        """
+        with _open_file(self._filename, 'rb') as file_to_verify:
+            signature = file_to_verify.read(len(STREAM_SIGNATURE))
+            if signature != STREAM_SIGNATURE:
+                raise ValueError("Compressed file has no checksums.")
+            if processes == 1 or not isinstance(self._filename, basestring):
+                frames = 0
+                for frame in self._read_frames(file_to_verify, signature):
+                    frames += 1
+                return frames
+            offsets = [entry[0] for entry in
+                    self._read_index(file_to_verify)]
+        step = VERIFIED_FRAMES_PER_TASK
+        tasks = ((self._filename, offsets[start:start + step])
+                for start in xrange(0, len(offsets), step))
+        self._run_in_pool(_verify_frames_in_process, tasks,
+                lambda result: None, processes)
+        return len(offsets)
+
+    def compose_frame(self, block):
+        """
+        Codes a block with its own table (or shared dictionary) and returns
+        its frame, frames are written after signature and before index (see
+        SeekIndex).
+
+        block - string of bytes
+        """
+        return self._compose_frame(block)
+
+    def read_frames(self, source):
+        """
+        Reads signature and frames of compressed file, yields frames to be
+        restored with restore_frame.
+
+        source - compressed file
+        """
+        signature = source.read(len(STREAM_SIGNATURE))
+        if signature not in FRAMED_SIGNATURES:
+            raise ValueError("Not a file compressed by blocks.")
+        return self._read_frames(source, signature)
+
+    def restore_frame(self, frame):
+        """
+        Decodes a frame and returns its block.
+
+        frame - frame yielded by read_frames
+        """
+        codec_id, length, table, data = frame
+        codec = find_codec(codec_id)
+        if table != '':
+            table = self._unpack_table(codec, table)
+        return self._restore_block(codec, length, table or None, data)
+
+    def _decode_contents(self, contents):
+        """
+        Decodes contents of file compressed whole with Huffman's code (by
+        earlier versions) and returns initial contents.
+
+        contents - string read from compressed file
+        """
+        header_length = len(SIGNATURE) + 8
+        if len(contents) < header_length or \
+                not contents.startswith(SIGNATURE):
+            raise ValueError("Not a compressed file.")
+        length = unpack_from('>Q', contents, len(SIGNATURE))[0]
+        if not length:
+            return ''
+        coder, offset = CanonicalHuffmanCoding.deserialize_code_lengths(
+                contents, header_length)
+        decoder = TableDecoder(coder.get_coded_alphabet())
+        return decoder.decode(contents, length, offset)
+
+    def _decode_stream(self, frames, target):
+        """
+        Decodes frames of compressed file and writes restored blocks one
+        by one.
+
+        frames - frames yielded by _read_frames
+        target - file to write restored blocks to
+        """
+        codecs = {}
+        tables = {}
+        for frame in frames:
+            codec_id, length, table, data = frame
+            if codec_id not in codecs:
+                codecs[codec_id] = find_codec(codec_id)
+            codec = codecs[codec_id]
+            if table and tables.get(codec_id, (None,))[0] != table:
+                tables[codec_id] = (table, self._unpack_table(codec, table))
+            self._write_frame(target, self._restore_block(codec, length,
+                tables[codec_id][1] if table else None, data))
+
+    def _unpack_table(self, codec, table):
+        """
+        Returns table of a frame.
+
+        codec - codec the frame was coded with
+        table - packed table or number of shared dictionary (see
+            _read_frames)
+        """
+        started = time()
+        if isinstance(table, basestring):
+            unpacked = codec.deserialize_table(table)[0]
+            table_length = len(table)
+        else:
+            unpacked = codec.get_dictionary_table(
+                    self._find_dictionary(table))
+            table_length = 0
+        if self._tracer is not None:
+            self._trace_stage('table', started, table_length, 0)
+        return unpacked
+
+    def _find_dictionary(self, dictionary_id):
+        """Returns shared dictionary by its number (loads it if needed)."""
+        if dictionary_id not in self._dictionaries:
+            self._dictionaries[dictionary_id] = find_dictionary(dictionary_id)
+        return self._dictionaries[dictionary_id]
+
+    def _get_dictionary_table(self):
+        """
+        Returns codec's table taken from shared dictionary (None if there
+        is no dictionary or codec can't use it).
+        """
+        if self._dictionary is None:
+            return None
+        return self._codec.get_dictionary_table(self._dictionary)
+
+    def _restore_block(self, codec, length, table, data):
+        """
+        Decodes coded data of a frame and returns the block.
+
+        codec - codec the block was coded with
+        length - quantity of bytes in the block
+        table - unpacked table of the frame (None if codec has no tables)
+        data - coded data
+        """
+        started = time()
+        block = codec.decode_block(data, length, table)
+        if self._tracer is not None:
+            self._trace_stage('decode', started, len(data), len(block))
+        return block
 
-    def _compose_compressed_strings(self, filename):
+    def _read_frames(self, source, signature=STREAM_SIGNATURE,
+            offsets=None):
         """
-        Makes list of compressed strings of file's contents.
+        Reads frames of compressed file. Yields tuples (number of codec,
+        length of block, packed table used by frame or number of shared
+        dictionary ('' if codec has no table), coded data).
 
-        filename - name of fileto make compressed string
+        source - compressed file positioned after signature
+        signature - signature of the file
+        offsets - increasing offsets of frames to read (frames following
+            the signature by default), frame with table must be read
+            before frames using the table
         """
-        with open(filename, 'rb') as file_to_compress:
-            strings_list = file_to_compress.readlines() 
-            alphabet = self._create_alphabet(strings_list)
-            coder = HuffmanCoding(alphabet)
-            coded_alphabet = dict(coder.get_coded_alphabet())
-            result = self._code_strings(strings_list, coded_alphabet)
-            return result
+        codecs = {}
+        tables = {}
+        if offsets is not None:
+            offsets = iter(offsets)
+        while True:
+            if offsets is not None:
+                offset = next(offsets, None)
+                if offset is None:
+                    break
+                source.seek(offset)
+            frame = self._read_frame(source, signature)
+            if frame is None:
+                break
+            codec_id, length, flags, data = frame
+            if codec_id not in codecs:
+                codecs[codec_id] = find_codec(codec_id)
+            offset = 0
+            if flags & FRAME_WITH_DICTIONARY:
+                if len(data) < 4:
+                    raise ValueError("Frame is damaged.")
+                offset = 4
+                yield codec_id, length, unpack_from('>I', data)[0], \
+                        data[offset:]
+                continue
+            if flags & FRAME_WITH_TABLE:
+                offset = codecs[codec_id].deserialize_table(data)[1]
+                tables[codec_id] = data[:offset]
+            elif codecs[codec_id].HAS_TABLE and codec_id not in tables:
+                raise ValueError("First frame has no table.")
+            yield codec_id, length, tables.get(codec_id, ''), data[offset:]
 
-    def _write_string(self, strings_list):
+    def _read_frame(self, source, signature=STREAM_SIGNATURE):
         """
-        Writes string to file.
+        Reads one frame and checks its checksum. Returns tuple (number of
+        codec, length of block, flags, data) or None for the last frame.
 
-        strings_list - list of strings read from a file
+        source - compressed file positioned at the frame
+        signature - signature of the file
         """
-        with open(self._filename.rpartition('.')[0] + '.' + 'ctf', 'wb') \
-                as file_to_write:
-                    for string in strings_list:
-                        file_to_write.write(string)
+        started = time()
+        header_format = {HUFFMAN_STREAM_SIGNATURE: HUFFMAN_FRAME_HEADER,
+                CODEC_STREAM_SIGNATURE: CODEC_FRAME_HEADER}.get(signature,
+                        FRAME_HEADER)
+        header_size = calcsize(header_format)
+        header = source.read(header_size)
+        if len(header) != header_size:
+            raise ValueError("Compressed file is truncated.")
+        checksum = None
+        if signature == HUFFMAN_STREAM_SIGNATURE:
+            codec_id = HuffmanBlockCodec.CODEC_ID
+            length, data_length, flags = unpack(header_format, header)
+        elif signature == CODEC_STREAM_SIGNATURE:
+            codec_id, length, data_length, flags = \
+                    unpack(header_format, header)
+        else:
+            codec_id, length, data_length, flags, checksum = \
+                    unpack(header_format, header)
+        if not length:
+            return None
+        data = source.read(data_length)
+        if len(data) != data_length:
+            raise ValueError("Compressed file is truncated.")
+        if checksum is not None and \
+                _get_checksum(header[:-4], data) != checksum:
+            raise ValueError("Frame is damaged.")
+        if self._tracer is not None:
+            self._trace_stage('read', started, header_size + data_length,
+                    header_size + data_length)
+        return codec_id, length, flags, data
 
-    def _create_alphabet(self, strings_list):
+    def _read_index(self, source):
         """
-        Creates alphabet from given list of strings.
+        Reads seek index of compressed file. Returns list of its entries
+        (see INDEX_ENTRY).
 
-        strings_list - list of initial strings   
+        source - compressed file, it must allow seeking
         """
-        letters_count = {}
-        quantity_of_letters = 0.
-        for string in strings_list:
-            for letter in string:
-                quantity_of_letters += 1
-                letters_count.setdefault(letter, 0)
-                letters_count[letter] += 1
-        alphabet = {}
-        for letter in letters_count.iterkeys():
-            alphabet[letter] = letters_count[letter] / quantity_of_letters
-        return alphabet
+        source.seek(0)
+        if source.read(len(STREAM_SIGNATURE)) != STREAM_SIGNATURE:
+            raise ValueError("Compressed file has no seek index.")
+        trailer_size = calcsize(INDEX_TRAILER)
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        if size < len(STREAM_SIGNATURE) + trailer_size:
+            raise ValueError("Compressed file is truncated.")
+        source.seek(size - trailer_size)
+        index_offset, count, checksum, index_signature = \
+                unpack(INDEX_TRAILER, source.read(trailer_size))
+        entry_size = calcsize(INDEX_ENTRY)
+        if index_signature != INDEX_SIGNATURE or \
+                index_offset + count * entry_size + trailer_size != size:
+            raise ValueError("Seek index is damaged.")
+        source.seek(index_offset)
+        data = source.read(count * entry_size)
+        if crc32(data) & 0xffffffff != checksum:
+            raise ValueError("Seek index is damaged.")
+        return [unpack_from(INDEX_ENTRY, data, i * entry_size)
+                for i in xrange(count)]
 
-    def _code_strings(self, strings_list, coded_alphabet):
+    def _read_blocks(self, source, block_size):
         """
-        Codes given strings list with coded alphabet and returns list of
-        coded strings.
+        Yields blocks of fixed size read from a file.
 
-        strings_list - list of initial strings
-        coded_alphabet - dictionary of letters and their codes
+        source - file to read
+        block_size - quantity of bytes in a block (None - whole file)
         """
-        coded_strings_list = []
-        for string in strings_list:
-            coded_string = ''
-            for symbol in string: 
-                coded_string += coded_alphabet[symbol]
-            coded_strings_list.append(coded_string)
-        return coded_strings_list
+        while True:
+            if block_size is None:
+                block = source.read()
+                block_size = 0
+            elif block_size:
+                block = source.read(block_size)
+            else:
+                break
+            if not block:
+                break
+            yield block
+
+    def _map_blocks(self, source, block_size):
+        """
+        Yields blocks of fixed size like _read_blocks, blocks of regular
+        file are buffers of file mapped to memory (mapping is closed when
+        the last buffer is released).
+
+        source - file to read
+        block_size - quantity of bytes in a block (None - whole file)
+        """
+        mapping = _map_file(source)
+        if mapping is None:
+            for block in self._read_blocks(source, block_size):
+                yield block
+            return
+        size = len(mapping)
+        step = block_size or size
+        for offset in xrange(0, size, step):
+            yield buffer(mapping, offset, step)
+
+    def _locate_blocks(self, source, block_size):
+        """
+        Yields tuples (name of file, offset, length) locating blocks of
+        regular file (processes of a pool map them by themselves) or blocks
+        read from other files.
+
+        source - file to read
+        block_size - quantity of bytes in a block
+        """
+        size = _get_mapped_size(source)
+        if not size or not isinstance(self._filename, basestring):
+            for block in self._read_blocks(source, block_size):
+                yield block
+            return
+        for offset in xrange(0, size, block_size):
+            yield self._filename, offset, min(block_size, size - offset)
+
+    def _create_table(self, block, any_block=False, codec=None):
+        """
+        Returns codec's table for a block (None if codec has no tables).
+
+        block - string of bytes
+        any_block - whether table must suit any other block as well
+        codec - codec of the block (codec of utility by default)
+        """
+        codec = codec or self._codec
+        if not codec.HAS_TABLE:
+            return None
+        started = time()
+        counts = count_bytes(block)
+        if self._tracer is not None:
+            self._trace_stage('histogram', started, len(block), 0)
+            started = time()
+        if self._table_cache is None or any_block:
+            table = codec.create_table(counts, any_block)
+        else:
+            table = self._get_cached_table(counts, codec)
+        if self._tracer is not None:
+            self._trace_stage('table', started, 0, 0)
+        return table
+
+    def _get_cached_table(self, counts, codec):
+        """
+        Returns codec's table for a block from cache of tables. Cached
+        tables are kept with flags of byte values they code; table that
+        doesn't code some values of block is rebuilt to code values of
+        both blocks.
+
+        counts - list of quantities of every byte value in the block
+        codec - codec of the block
+        """
+        present = [value for value, count in enumerate(counts) if count]
+        def suits_table(cached):
+            table, coded_values = cached
+            for value in present:
+                if not coded_values[value]:
+                    return False
+            return True
+        def create_table(cached):
+            if cached is None:
+                coded_values = bytearray(len(counts))
+            else:
+                coded_values = bytearray(cached[1])
+            for value in present:
+                coded_values[value] = 1
+            # Values met only in other blocks get the smallest weight
+            weights = [count * CACHED_TABLE_SCALE or coded_values[value]
+                    for value, count in enumerate(counts)]
+            return codec.create_table(weights), coded_values
+        return self._table_cache.get_table(codec.get_table_namespace(),
+                counts, create_table, suits_table)[0]
+
+    def _compose_frame(self, block, table=None, with_table=True):
+        """
+        Codes a block and returns its frame. If codec chooses codec for
+        every block, block is stored as it is when chosen codec doesn't
+        make it smaller.
+
+        block - string of bytes
+        table - codec's table to use (block's own by default)
+        with_table - whether frame carries the table
+        """
+        codec = self._codec
+        flags = 0
+        data = ''
+        if table is None:
+            started = time()
+            codec = codec.select_codec(block)
+            if codec is not self._codec and self._tracer is not None:
+                self._trace_stage('select', started, len(block), 0)
+            table = self._get_dictionary_table()
+            if table is None:
+                table = self._create_table(block, codec=codec)
+            else:
+                flags |= FRAME_WITH_DICTIONARY
+                data = pack('>I', self._dictionary.get_id())
+                with_table = False
+        started = time()
+        if table is not None and with_table:
+            flags |= FRAME_WITH_TABLE
+            data = codec.serialize_table(table)
+        data += codec.encode_block(block, table)
+        if codec is not self._codec and len(data) >= len(block):
+            codec = RawBlockCodec()
+            flags = 0
+            data = codec.encode_block(block)
+        if self._tracer is not None:
+            self._trace_stage('encode', started, len(block), len(data))
+        fields = pack(CODEC_FRAME_HEADER, codec.CODEC_ID, len(block),
+                len(data), flags)
+        return fields + pack('>I', _get_checksum(fields, data)) + data
+
+    def _write_frame(self, target, string):
+        """Writes a frame (or a restored block) to a file."""
+        started = time()
+        target.write(string)
+        if self._tracer is not None:
+            self._trace_stage('write', started, len(string), len(string))
+
+    def _report_stages(self, stages):
+        """
+        Passes timings of stages gathered in a process of a pool to tracer.
+
+        stages - dictionary made by RecordingTracer.get_stages (None if
+            tracing is off)
+        """
+        if stages:
+            for name, totals in stages.iteritems():
+                self._tracer.stage(name, totals['seconds'],
+                        totals['bytes_in'], totals['bytes_out'])
+
+    def _run_in_pool(self, function, tasks, write, processes=None):
+        """
+        Applies function to every task in a pool of processes and writes
+        results in order of tasks. Only a few tasks per process are queued
+        at once, so tasks are read as results are written.
+
+        function - module-level function of one argument
+        tasks - iterable of arguments
+        write - function called with every result
+        processes - quantity of processes (number of CPUs by default)
+        """
+        if processes is None:
+            processes = cpu_count()
+        pool = Pool(processes)
+        try:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(function, (task,)))
+                if len(pending) >= 2 * processes:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_compressed_filename(self):
+        """Returns default name of compressed file."""
+        if not isinstance(self._filename, basestring):
+            raise ValueError("Name of compressed file is needed.")
+        return self._filename.rpartition('.')[0] + '.' + 'ctf'
+
+    def _get_restored_filename(self):
+        """Returns default name of restored file."""
+        if not isinstance(self._filename, basestring):
+            raise ValueError("Name of restored file is needed.")
+        return self._filename.rpartition('.')[0]
+
+
+class SeekIndex(object):
+    """
+    Collects entries of seek index while frames are written, file ends
+    with what pack returns.
+
+    _position - offset of the next frame in compressed file
+    _initial_size - quantity of bytes in blocks of frames
+    _tables - dictionary with numbers of codecs and offsets of the last
+        frames with their tables
+    _entries - list of packed entries
+    """
+    def __init__(self):
+        super(SeekIndex, self).__init__()
+        self._position = len(STREAM_SIGNATURE)
+        self._initial_size = 0
+        self._tables = {}
+        self._entries = []
+
+    def get_initial_size(self):
+        """Returns quantity of bytes in blocks of frames."""
+        return self._initial_size
+
+    def add(self, frame):
+        """Adds entry of a frame written after previous ones."""
+        codec_id, length, data_length, flags, checksum = \
+                unpack_from(FRAME_HEADER, frame)
+        if flags & FRAME_WITH_TABLE:
+            self._tables[codec_id] = self._position
+        table_position = self._position
+        if not flags & FRAME_WITH_DICTIONARY:
+            table_position = self._tables.get(codec_id, self._position)
+        self._entries.append(pack(INDEX_ENTRY, self._position,
+            self._initial_size, table_position))
+        self._position += len(frame)
+        self._initial_size += length
+
+    def pack(self):
+        """Returns the last frame followed by index and its trailer."""
+        end = pack(CODEC_FRAME_HEADER, 0, 0, 0, 0)
+        end += pack('>I', _get_checksum(end, ''))
+        entries = ''.join(self._entries)
+        return end + entries + pack(INDEX_TRAILER, self._position + len(end),
+                len(self._entries), crc32(entries) & 0xffffffff,
+                INDEX_SIGNATURE)
+
+
+def _get_checksum(fields, data):
+    """Returns CRC32 of fields of frame's header and frame's data."""
+    return crc32(data, crc32(fields)) & 0xffffffff
+
+
+@contextmanager
+def _open_file(file_or_name, mode):
+    """
+    Opens file by name and closes it after use, opened file is used as it
+    is (and left open).
+
+    file_or_name - name of file or opened file
+    mode - mode of opening
+    """
+    if isinstance(file_or_name, basestring):
+        with open(file_or_name, mode) as opened_file:
+            yield opened_file
+    else:
+        yield file_or_name
+
+
+def _tell(opened_file):
+    """Returns position in a file (0 for pipes and other streams)."""
+    try:
+        return opened_file.tell()
+    except (IOError, AttributeError):
+        return 0
+
+
+def _get_mapped_size(source):
+    """
+    Returns size of a file if it can be mapped to memory (None for empty
+    files and files that aren't regular, e.g. pipes).
+
+    source - opened file
+    """
+    try:
+        status = os.fstat(source.fileno())
+    except (AttributeError, ValueError, EnvironmentError):
+        return None
+    if not S_ISREG(status.st_mode) or not status.st_size:
+        return None
+    return status.st_size
+
+
+def _map_file(source):
+    """
+    Maps whole file to memory for reading. Returns the mapping (None if
+    file can't be mapped).
+
+    source - opened file
+    """
+    if not _get_mapped_size(source):
+        return None
+    try:
+        return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError, EnvironmentError):
+        return None
+
+
+def _compose_frame_in_process(task):
+    """
+    Codes a block with its own table (or shared dictionary) in a process
+    of a pool. Returns tuple (frame, timings of stages or None).
+
+    task - tuple (codec, block or its location (see
+        FileCompressionUtility._locate_blocks), whether stages are timed,
+        shared dictionary or None)
+    """
+    codec, block, traced, dictionary = task
+    if isinstance(block, tuple):
+        filename, offset, length = block
+        with open(filename, 'rb') as source:
+            block = buffer(_map_file(source), offset, length)
+    tracer = RecordingTracer(False) if traced else None
+    utility = FileCompressionUtility(None, codec, tracer,
+            dictionary=dictionary)
+    return utility._compose_frame(block), tracer and tracer.get_stages()
+
+
+def _verify_frames_in_process(task):
+    """
+    Checks checksums of frames in a process of a pool (raises ValueError
+    if a frame is damaged).
+
+    task - tuple (name of compressed file, offsets of frames)
+    """
+    filename, offsets = task
+    utility = FileCompressionUtility(None)
+    with open(filename, 'rb') as source:
+        for offset in offsets:
+            source.seek(offset)
+            utility._read_frame(source)
+
+
+def _restore_block_in_process(task):
+    """
+    Decodes a frame in a process of a pool. Returns tuple (block, timings
+    of stages or None).
+
+    task - tuple (frame yielded by FileCompressionUtility._read_frames,
+        whether stages are timed, shared dictionary or None)
+    """
+    frame, traced, dictionary = task
+    tracer = RecordingTracer(False) if traced else None
+    utility = FileCompressionUtility(None, tracer=tracer,
+            dictionary=dictionary)
+    return utility.restore_frame(frame), tracer and tracer.get_stages()
 
 
 if __name__ == '__main__':
     compresing_utility = FileCompressionUtility('initial_file.txt')
     compresing_utility.compress()
+    compresing_utility.set_codec('lz77')
+    compresing_utility.compress('initial_file.lz77.ctf')
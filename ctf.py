@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+from time import time
+from cStringIO import StringIO
+from argparse import ArgumentParser
+from compressor import FileCompressionUtility, DEFAULT_BLOCK_SIZE
+from block_codecs import CODECS, MIN_LEVEL, MAX_LEVEL, DEFAULT_LEVEL, \
+        create_codec
+
+# Extension of compressed files
+EXTENSION = '.ctf'
+# Name of file standing for stdin (or stdout)
+STANDARD_STREAM = '-'
+# Short options accepted instead of commands, so tool can be used like
+# other compressors in pipelines (e.g. tar c dir | ctf -c > dir.tar.ctf)
+COMMAND_ALIASES = {'-c': 'compress', '-d': 'decompress', '-t': 'test'}
+
+def create_parser():
+    """Returns parser of command line arguments."""
+    parser = ArgumentParser(prog='ctf',
+            description='Compresses files by blocks with chosen codec. '
+            'Without files (or with %s) reads stdin and writes stdout.' %
+            STANDARD_STREAM)
+    commands = parser.add_subparsers(dest='command')
+    compress_parser = commands.add_parser('compress',
+            help='compress files (alias -c)')
+    _add_files_arguments(compress_parser)
+    _add_codec_arguments(compress_parser)
+    compress_parser.add_argument('--block-size', type=_parse_size,
+            default=DEFAULT_BLOCK_SIZE,
+            help='size of blocks, K and M suffixes are allowed '
+            '(default: %(default)s)')
+    compress_parser.add_argument('--shared-table', action='store_true',
+            help='use table of the first block for all blocks')
+    _add_threads_argument(compress_parser)
+    decompress_parser = commands.add_parser('decompress',
+            help='restore compressed files (alias -d)')
+    _add_files_arguments(decompress_parser)
+    _add_threads_argument(decompress_parser)
+    test_parser = commands.add_parser('test',
+            help='check that compressed files can be restored (alias -t)')
+    test_parser.add_argument('files', nargs='*',
+            help='compressed files (stdin by default)')
+    test_parser.add_argument('--quick', action='store_true',
+            help="only check checksums of frames, don't decode them")
+    _add_threads_argument(test_parser)
+    bench_parser = commands.add_parser('bench',
+            help='measure compression of files, report is printed as JSON')
+    bench_parser.add_argument('files', nargs='*',
+            help='files to measure (stdin by default)')
+    _add_codec_arguments(bench_parser)
+    bench_parser.add_argument('--block-size', type=_parse_size,
+            default=DEFAULT_BLOCK_SIZE,
+            help='size of blocks (default: %(default)s)')
+    return parser
+
+
+def main(arguments=None):
+    """
+    Runs command given in command line. Returns exit status.
+
+    arguments - list of arguments (sys.argv without program by default)
+    """
+    if arguments is None:
+        arguments = sys.argv[1:]
+    if arguments and arguments[0] in COMMAND_ALIASES:
+        arguments = [COMMAND_ALIASES[arguments[0]]] + list(arguments[1:])
+    options = create_parser().parse_args(arguments)
+    files = options.files or [STANDARD_STREAM]
+    if options.command == 'bench':
+        report = [_measure(filename, options) for filename in files]
+        print json.dumps(report, indent=2, sort_keys=True)
+        return 0
+    status = 0
+    for filename in files:
+        try:
+            if options.command == 'compress':
+                _compress(filename, options)
+            elif options.command == 'decompress':
+                _decompress(filename, options)
+            else:
+                _test(filename, options)
+        except (ValueError, EnvironmentError) as error:
+            sys.stderr.write('ctf: %s: %s\n' % (filename, error))
+            status = 1
+    return status
+
+
+def _add_files_arguments(parser):
+    """Adds names of input files and options of output."""
+    parser.add_argument('files', nargs='*',
+            help='files to process (stdin by default)')
+    parser.add_argument('-o', '--output',
+            help='output file (only with one input file)')
+    parser.add_argument('--stdout', action='store_true',
+            help='write to stdout instead of files')
+
+
+def _add_codec_arguments(parser):
+    """Adds choice of codec and level."""
+    parser.add_argument('--codec', choices=sorted(CODECS),
+            default='huffman', help='codec of blocks (default: %(default)s)')
+    parser.add_argument('--level', type=int, default=DEFAULT_LEVEL,
+            choices=range(MIN_LEVEL, MAX_LEVEL + 1), metavar='LEVEL',
+            help='%d (fastest) to %d (smallest output), default: '
+            '%%(default)s' % (MIN_LEVEL, MAX_LEVEL))
+
+
+def _add_threads_argument(parser):
+    """Adds quantity of processes."""
+    parser.add_argument('--threads', type=int, default=1,
+            help='quantity of worker processes (0 - one per CPU)')
+
+
+def _parse_size(text):
+    """Returns size given as a number with optional K or M suffix."""
+    multipliers = {'K': 1 << 10, 'M': 1 << 20}
+    multiplier = multipliers.get(text[-1:].upper(), 1)
+    if multiplier != 1:
+        text = text[:-1]
+    size = int(text) * multiplier
+    if size <= 0:
+        raise ValueError("Size must be positive.")
+    return size
+
+
+def _get_output(filename, options, default):
+    """
+    Returns name of output file or opened file (stdout).
+
+    filename - name of input file
+    options - parsed arguments
+    default - function returning default name of output file
+    """
+    if options.output:
+        if len(options.files) > 1:
+            raise ValueError("Output file is given for many inputs.")
+        return options.output
+    if options.stdout or filename == STANDARD_STREAM:
+        return sys.stdout
+    return default(filename)
+
+
+def _open_input(filename):
+    """Returns name of input file or opened file (stdin)."""
+    if filename == STANDARD_STREAM:
+        return sys.stdin
+    return filename
+
+
+def _get_processes(threads):
+    """Returns quantity of processes of a pool (None - one per CPU)."""
+    return threads or None
+
+
+def _compress(filename, options):
+    """Compresses one file (or stdin)."""
+    output = _get_output(filename, options,
+            lambda filename: filename + EXTENSION)
+    utility = FileCompressionUtility(_open_input(filename),
+            create_codec(options.codec, options.level))
+    if options.threads != 1 and not options.shared_table:
+        utility.compress_parallel(output, options.block_size,
+                _get_processes(options.threads))
+    else:
+        utility.compress_stream(output, options.block_size,
+                not options.shared_table)
+    _flush(output)
+
+
+def _decompress(filename, options):
+    """Restores one file (or stdin)."""
+    def get_default_output(filename):
+        if not filename.endswith(EXTENSION):
+            raise ValueError("Unknown extension, output file is needed.")
+        return filename[:-len(EXTENSION)]
+    output = _get_output(filename, options, get_default_output)
+    utility = FileCompressionUtility(_open_input(filename))
+    if options.threads != 1:
+        utility.decompress_parallel(output, _get_processes(options.threads))
+    else:
+        utility.decompress(output)
+    _flush(output)
+
+
+def _test(filename, options):
+    """Restores one file (or stdin) discarding the result."""
+    utility = FileCompressionUtility(_open_input(filename))
+    if options.quick:
+        utility.verify(_get_processes(options.threads))
+        return
+    with open(os.devnull, 'wb') as output:
+        if options.threads != 1:
+            utility.decompress_parallel(output,
+                    _get_processes(options.threads))
+        else:
+            utility.decompress(output)
+
+
+def _flush(output):
+    """Flushes output if it's an opened file."""
+    if not isinstance(output, basestring):
+        output.flush()
+
+
+def _measure(filename, options):
+    """
+    Compresses and restores one file (or stdin) in memory. Returns
+    dictionary of sizes and speeds.
+    """
+    if filename == STANDARD_STREAM:
+        data = sys.stdin.read()
+    else:
+        with open(filename, 'rb') as measured_file:
+            data = measured_file.read()
+    compressed = StringIO()
+    started = time()
+    FileCompressionUtility(StringIO(data), create_codec(options.codec,
+        options.level)).compress_stream(compressed, options.block_size)
+    compress_time = time() - started
+    restored = StringIO()
+    started = time()
+    FileCompressionUtility(StringIO(compressed.getvalue())).decompress(
+            restored)
+    decompress_time = time() - started
+    compressed_size = len(compressed.getvalue())
+    return {
+            'file': filename,
+            'codec': options.codec,
+            'level': options.level,
+            'size': len(data),
+            'compressed_size': compressed_size,
+            'ratio': float(len(data)) / compressed_size,
+            'compress_mb_s': len(data) / 1e6 / max(compress_time, 1e-9),
+            'decompress_mb_s': len(data) / 1e6 / max(decompress_time, 1e-9),
+            'roundtrip': restored.getvalue() == data,
+            }
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,79 @@
-# -*- coding: utf-8 -*- 
+# -*- coding: utf-8 -*-
 
 from math import log
 
+try:
+    import numpy
+except ImportError:
+    # Statistics are gathered with plain Python then
+    numpy = None
+
 def find_information_entropy(*distribution):
     """
     Finds value of entropy according to Shannon for a given distribution.
 
     *distibution - probability values of some ditribution
     """
+    if numpy is not None and len(distribution) > 16:
+        probabilities = numpy.asarray(distribution, dtype=numpy.float64)
+        probabilities = probabilities[probabilities > 0]
+        return float(-numpy.dot(probabilities, numpy.log2(probabilities)))
     entropy = 0
     for probability in distribution:
-        entropy -=  (probability * log(probability, 2.))
+        if probability:
+            entropy -=  (probability * log(probability, 2.))
     return entropy
 
 
+def count_bytes(data):
+    """
+    Returns list of 256 quantities of every byte value in data.
+
+    data - string (or other buffer) of bytes
+    """
+    if numpy is not None:
+        return numpy.bincount(numpy.frombuffer(data, dtype=numpy.uint8),
+                minlength=256).tolist()
+    counts = [0] * 256
+    for value in bytearray(data):
+        counts[value] += 1
+    return counts
+
+
+def find_counts_entropy(counts):
+    """
+    Finds entropy (bits per symbol) of distribution given by quantities of
+    symbols.
+
+    counts - list of quantities of symbols
+    """
+    total = float(sum(counts))
+    if not total:
+        return 0.
+    if numpy is not None:
+        frequencies = numpy.asarray(counts, dtype=numpy.float64)
+        frequencies = frequencies[frequencies > 0]
+        entropy = numpy.log2(total) - \
+                numpy.dot(frequencies, numpy.log2(frequencies)) / total
+        return max(0., float(entropy))
+    return find_information_entropy(*[count / total
+        for count in counts if count])
+
+
+def find_blocks_statistics(data, block_size):
+    """
+    Returns list of tuples (quantities of byte values, entropy) for every
+    block of data.
+
+    data - string (or other buffer) of bytes
+    block_size - quantity of bytes in a block
+    """
+    result = []
+    for offset in xrange(0, len(data), block_size):
+        block_counts = count_bytes(data[offset:offset + block_size])
+        result.append((block_counts, find_counts_entropy(block_counts)))
+    return result
+
+
 if __name__ == '__main__':
     print find_information_entropy(4./11, 4./11, 3./11)
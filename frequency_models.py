@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_right
+
+# Total frequency of a model must not exceed it to keep range coder precise
+MAX_TOTAL_FREQUENCY = 1 << 16
+
+class FrequencyModel(object):
+    """
+    Describes interface of models giving integer frequencies of symbols to
+    range coder. Symbol with cumulative frequency low and frequency
+    high - low occupies [low, high) of [0, total).
+    """
+    def reset(self):
+        """Returns model to its initial state."""
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def get_total(self):
+        """Returns total frequency of all symbols."""
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def get_range(self, symbol):
+        """Returns tuple (low, high) of cumulative frequencies of symbol."""
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def find_symbol(self, value):
+        """
+        Returns tuple (symbol, low, high) for symbol whose range contains
+        value.
+        """
+        raise NotImplementedError("Should be implemented in child class.")
+
+    def update(self, symbol):
+        """Updates model after symbol is coded."""
+        raise NotImplementedError("Should be implemented in child class.")
+
+
+class StaticFrequencyModel(FrequencyModel):
+    """
+    Represents model with fixed frequencies of symbols.
+
+    symbols_count - dictionary with symbols and their (integer) frequencies
+    """
+    def __init__(self, symbols_count):
+        super(StaticFrequencyModel, self).__init__()
+        self._symbols = sorted(symbol for symbol in symbols_count
+                if symbols_count[symbol] > 0)
+        self._lows = []
+        self._ranges = {}
+        total = 0
+        for symbol in self._symbols:
+            self._lows.append(total)
+            high = total + symbols_count[symbol]
+            self._ranges[symbol] = (total, high)
+            total = high
+        if total > MAX_TOTAL_FREQUENCY:
+            raise ValueError("Total frequency is too big.")
+        self._total = total
+
+    @classmethod
+    def from_probabilities(cls, symbols_probability,
+            total=MAX_TOTAL_FREQUENCY):
+        """
+        Creates model approximating probabilities with integer frequencies
+        (every symbol gets at least 1).
+
+        symbols_probability - dictionary with symbols and probabilities
+        total - upper bound of total frequency
+        """
+        scale = total - len(symbols_probability)
+        return cls(dict((symbol, 1 + int(probability * scale))
+            for symbol, probability in symbols_probability.iteritems()))
+
+    def reset(self):
+        pass
+
+    def get_total(self):
+        return self._total
+
+    def get_range(self, symbol):
+        return self._ranges[symbol]
+
+    def find_symbol(self, value):
+        symbol = self._symbols[bisect_right(self._lows, value) - 1]
+        low, high = self._ranges[symbol]
+        return symbol, low, high
+
+    def update(self, symbol):
+        pass
+
+
+class FenwickTree(object):
+    """
+    Represents binary indexed (Fenwick) tree over a list of frequencies:
+    changing a frequency and finding cumulative frequencies take
+    O(log n).
+
+    frequencies - initial list of frequencies
+    """
+    def __init__(self, frequencies):
+        super(FenwickTree, self).__init__()
+        self._size = len(frequencies)
+        self._top_bit = 1
+        while self._top_bit * 2 <= self._size:
+            self._top_bit *= 2
+        self._build(frequencies)
+
+    def add(self, index, delta):
+        """Adds delta to frequency with given index."""
+        tree = self._tree
+        index += 1
+        while index <= self._size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Returns sum of frequencies with indexes less than index."""
+        tree = self._tree
+        result = 0
+        while index:
+            result += tree[index]
+            index &= index - 1
+        return result
+
+    def find(self, value):
+        """
+        Returns index of frequency whose cumulative range contains value
+        (value must be less than sum of all frequencies).
+        """
+        tree = self._tree
+        index = 0
+        bit = self._top_bit
+        while bit:
+            next_index = index + bit
+            if next_index <= self._size and tree[next_index] <= value:
+                index = next_index
+                value -= tree[next_index]
+            bit >>= 1
+        return index
+
+    def _build(self, frequencies):
+        """Builds tree from list of frequencies in linear time."""
+        tree = [0] + list(frequencies)
+        for index in xrange(1, self._size + 1):
+            parent = index + (index & -index)
+            if parent <= self._size:
+                tree[parent] += tree[index]
+        self._tree = tree
+
+
+class AdaptiveFrequencyModel(FrequencyModel):
+    """
+    Represents order-0 model which frequencies grow as symbols are coded.
+    Every symbol starts with frequency 1; when total frequency exceeds the
+    limit all frequencies are halved, so recent symbols weigh more.
+
+    symbols - list of all symbols that may be coded
+    increment - how much frequency of symbol grows when it's coded
+    limit - upper bound of total frequency
+    """
+    def __init__(self, symbols, increment=32, limit=MAX_TOTAL_FREQUENCY):
+        super(AdaptiveFrequencyModel, self).__init__()
+        if len(symbols) + increment > limit:
+            raise ValueError("Too many symbols for frequency limit.")
+        self._symbols = list(symbols)
+        self._indexes = dict((symbol, index)
+                for index, symbol in enumerate(self._symbols))
+        self._increment = increment
+        self._limit = limit
+        self.reset()
+
+    def reset(self):
+        self._frequencies = [1] * len(self._symbols)
+        self._tree = FenwickTree(self._frequencies)
+        self._total = len(self._symbols)
+
+    def get_total(self):
+        return self._total
+
+    def get_range(self, symbol):
+        index = self._indexes[symbol]
+        low = self._tree.prefix_sum(index)
+        return low, low + self._frequencies[index]
+
+    def find_symbol(self, value):
+        index = self._tree.find(value)
+        low = self._tree.prefix_sum(index)
+        return self._symbols[index], low, low + self._frequencies[index]
+
+    def update(self, symbol):
+        index = self._indexes[symbol]
+        self._frequencies[index] += self._increment
+        self._tree.add(index, self._increment)
+        self._total += self._increment
+        if self._total > self._limit:
+            self._rescale()
+
+    def _rescale(self):
+        """Halves all frequencies (keeping them positive)."""
+        self._frequencies = [(frequency + 1) // 2
+                for frequency in self._frequencies]
+        self._tree = FenwickTree(self._frequencies)
+        self._total = sum(self._frequencies)
+
+
+class ContextFrequencyModel(FrequencyModel):
+    """
+    Represents order-k model: every context (k previous symbols) has its
+    own adaptive order-0 model, created when context is met first time.
+    Encoder and decoder see the same symbols, so their contexts match
+    without any table being stored.
+
+    symbols - list of all symbols that may be coded
+    order - quantity of previous symbols forming a context
+    increment - how much frequency of symbol grows when it's coded
+    limit - upper bound of total frequency in every context
+    """
+    def __init__(self, symbols, order=1, increment=32,
+            limit=MAX_TOTAL_FREQUENCY):
+        super(ContextFrequencyModel, self).__init__()
+        self._symbols = list(symbols)
+        self._order = order
+        self._increment = increment
+        self._limit = limit
+        self.reset()
+
+    def get_order(self):
+        """Returns quantity of previous symbols forming a context."""
+        return self._order
+
+    def reset(self):
+        self._contexts = {}
+        self._context = ()
+        self._model = self._get_context_model(self._context)
+
+    def get_total(self):
+        return self._model.get_total()
+
+    def get_range(self, symbol):
+        return self._model.get_range(symbol)
+
+    def find_symbol(self, value):
+        return self._model.find_symbol(value)
+
+    def update(self, symbol):
+        self._model.update(symbol)
+        if self._order:
+            self._context = (self._context + (symbol,))[-self._order:]
+        self._model = self._get_context_model(self._context)
+
+    def _get_context_model(self, context):
+        """Returns model of given context (creates it if needed)."""
+        model = self._contexts.get(context)
+        if model is None:
+            model = AdaptiveFrequencyModel(self._symbols, self._increment,
+                    self._limit)
+            self._contexts[context] = model
+        return model
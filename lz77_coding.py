@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from struct import pack, unpack_from
+from coding_algorithms import CanonicalHuffmanCoding
+from bit_io import BitWriter, BitReader
+from table_decoding import TableDecoder
+
+MIN_MATCH = 3
+MAX_MATCH = 258
+END_SYMBOL = 256
+# Lengths of matches are coded like in deflate: symbol 257 + i stands for
+# LENGTH_BASES[i] plus LENGTH_EXTRA_BITS[i] extra bits
+LENGTH_BASES = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31,
+        35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258]
+LENGTH_EXTRA_BITS = [0] * 8 + [1] * 4 + [2] * 4 + [3] * 4 + [4] * 4 + \
+        [5] * 4 + [0]
+# Distances are coded like in deflate, continued for windows up to 4 GB:
+# symbol i stands for DISTANCE_BASES[i] plus DISTANCE_EXTRA_BITS[i] bits
+DISTANCE_EXTRA_BITS = [0] * 4 + [symbol // 2 - 1 for symbol in xrange(4, 64)]
+DISTANCE_BASES = range(1, 5) + [((2 | (symbol & 1)) << (symbol // 2 - 1)) + 1
+        for symbol in xrange(4, 64)]
+
+class LZ77Coding(object):
+    """
+    Represents LZ77 coding: string is replaced by literals and references
+    (length, distance) to earlier occurrences found in a sliding window with
+    hash chains. Literals and lengths share one canonical Huffman's code,
+    distances have another one (like in deflate); coded string holds both
+    tables of code lengths and packed codes ended by END_SYMBOL.
+
+    input_string - string to be coded
+    window_size - how far back references may point
+    max_chain - how much earlier positions are tried for every match
+        (longer search gives better compression, but takes more time)
+    lazy - whether match is postponed when next position has a longer one
+    """
+    def __init__(self, input_string, window_size=32768, max_chain=32,
+            lazy=True):
+        super(LZ77Coding, self).__init__()
+        self._input_string = input_string
+        self._window_size = window_size
+        self._max_chain = max_chain
+        self._lazy = lazy
+        self._tokens = None
+        self._coded_string = None
+
+    def get_input_string(self):
+        """Returns current string to encode."""
+        return self._input_string
+
+    def set_input_string(self, new_string):
+        """Sets current string to encode."""
+        self._input_string = new_string
+        self._tokens = None
+        self._coded_string = None
+
+    def get_tokens(self):
+        """
+        Returns list of tokens: byte values for literals and tuples
+        (length, distance) for references.
+        """
+        if self._tokens is None:
+            self._tokens = self._find_tokens(self._input_string)
+        return self._tokens
+
+    def get_coded_string(self):
+        """Returns encoded string (codes it if needed)."""
+        if self._coded_string is None:
+            self._coded_string = self._encode_tokens(self.get_tokens())
+        return self._coded_string
+
+    def decode_string(self, coded_string, offset=0):
+        """
+        Restores string from coded one.
+
+        coded_string - string produced by get_coded_string
+        offset - position of coded data in coded_string
+        """
+        literal_coder, offset = self._load_code_lengths(coded_string, offset,
+                '>H', 2)
+        distance_coder, offset = self._load_code_lengths(coded_string,
+                offset, '>B', 1)
+        literal_decoder = TableDecoder(literal_coder.get_coded_alphabet())
+        distance_decoder = None
+        if distance_coder.get_code_lengths():
+            distance_decoder = TableDecoder(
+                    distance_coder.get_coded_alphabet())
+        reader = BitReader(coded_string, offset)
+        result = bytearray()
+        while True:
+            if not reader.get_bits_left():
+                raise ValueError("Coded string is truncated.")
+            symbol = literal_decoder.decode_symbol(reader)
+            if symbol < END_SYMBOL:
+                result.append(symbol)
+                continue
+            if symbol == END_SYMBOL:
+                break
+            index = symbol - END_SYMBOL - 1
+            length = LENGTH_BASES[index] + \
+                    reader.read(LENGTH_EXTRA_BITS[index])
+            if distance_decoder is None:
+                raise ValueError("Reference without code of distances.")
+            index = distance_decoder.decode_symbol(reader)
+            distance = DISTANCE_BASES[index] + \
+                    reader.read(DISTANCE_EXTRA_BITS[index])
+            start = len(result) - distance
+            if start < 0:
+                raise ValueError("Reference points before start of string.")
+            if distance >= length:
+                result.extend(result[start:start + length])
+            else:
+                # Overlapping reference repeats last distance bytes
+                chunk = result[start:]
+                result.extend((chunk * (length // distance + 1))[:length])
+        return str(result)
+
+    def _find_tokens(self, data):
+        """Divides string to literals and references."""
+        length_of_data = len(data)
+        # Last position of every three bytes and previous position with the
+        # same three bytes for every position
+        head = {}
+        previous = array('i', [-1]) * length_of_data
+        tokens = []
+        position = 0
+        match = self._find_match(data, 0, head, previous)
+        while position < length_of_data:
+            self._insert(data, position, head, previous)
+            length, distance = match
+            if length >= MIN_MATCH:
+                if self._lazy and length < MAX_MATCH:
+                    next_match = self._find_match(data, position + 1, head,
+                            previous)
+                    if next_match[0] > length:
+                        # Better match starts at the next byte
+                        tokens.append(ord(data[position]))
+                        position += 1
+                        match = next_match
+                        continue
+                tokens.append(match)
+                for inner in xrange(position + 1, position + length):
+                    self._insert(data, inner, head, previous)
+                position += length
+            else:
+                tokens.append(ord(data[position]))
+                position += 1
+            match = self._find_match(data, position, head, previous)
+        return tokens
+
+    def _insert(self, data, position, head, previous):
+        """Adds position to hash chain of its three bytes."""
+        key = data[position:position + MIN_MATCH]
+        if len(key) == MIN_MATCH:
+            previous[position] = head.get(key, -1)
+            head[key] = position
+
+    def _find_match(self, data, position, head, previous):
+        """
+        Returns the longest match (length, distance) for position found in
+        hash chain ((0, 0) if there is none).
+        """
+        key = data[position:position + MIN_MATCH]
+        if len(key) < MIN_MATCH:
+            return 0, 0
+        candidate = head.get(key, -1)
+        max_length = min(MAX_MATCH, len(data) - position)
+        lowest = position - self._window_size
+        best_length = 0
+        best_distance = 0
+        chain = self._max_chain
+        while candidate >= 0 and candidate >= lowest and chain:
+            chain -= 1
+            # Candidate can be longer only if it matches at best_length
+            if data[candidate + best_length] == data[position + best_length]:
+                length = MIN_MATCH
+                while length + 16 <= max_length and \
+                        data[candidate + length:candidate + length + 16] == \
+                        data[position + length:position + length + 16]:
+                    length += 16
+                while length < max_length and \
+                        data[candidate + length] == data[position + length]:
+                    length += 1
+                if length > best_length:
+                    best_length = length
+                    best_distance = position - candidate
+                    if length == max_length:
+                        break
+            candidate = previous[candidate]
+        return best_length, best_distance
+
+    def _encode_tokens(self, tokens):
+        """Codes tokens with canonical Huffman's codes."""
+        length_codes = self._get_length_codes()
+        # Tokens as (symbol, extra bits, quantity of extra bits, distance
+        # symbol, extra bits, quantity of extra bits)
+        symbols = []
+        literal_counts = {END_SYMBOL: 1}
+        distance_counts = {}
+        for token in tokens:
+            if isinstance(token, tuple):
+                length, distance = token
+                symbol, extra, extra_bits = length_codes[length]
+                distance_symbol, distance_extra, distance_bits = \
+                        self._get_distance_code(distance)
+                symbols.append((symbol, extra, extra_bits, distance_symbol,
+                    distance_extra, distance_bits))
+                distance_counts[distance_symbol] = \
+                        distance_counts.get(distance_symbol, 0) + 1
+            else:
+                symbol = token
+                symbols.append((symbol, 0, 0, None, 0, 0))
+            literal_counts[symbol] = literal_counts.get(symbol, 0) + 1
+
+        # Huffman's algorithm needs only relative weights of symbols
+        literal_coder = CanonicalHuffmanCoding(literal_counts)
+        distance_coder = CanonicalHuffmanCoding(distance_counts)
+        literal_codes = literal_coder.get_numeric_codes()
+        distance_codes = distance_coder.get_numeric_codes()
+
+        writer = BitWriter()
+        write = writer.write
+        for symbol, extra, extra_bits, distance_symbol, distance_extra, \
+                distance_bits in symbols:
+            write(*literal_codes[symbol])
+            if distance_symbol is not None:
+                write(extra, extra_bits)
+                write(*distance_codes[distance_symbol])
+                write(distance_extra, distance_bits)
+        write(*literal_codes[END_SYMBOL])
+
+        return self._save_code_lengths(literal_coder, '>H') + \
+                self._save_code_lengths(distance_coder, '>B') + \
+                writer.get_bytes()
+
+    def _save_code_lengths(self, coder, count_format):
+        """
+        Packs code lengths of numeric symbols: quantity of symbols (up to
+        the last coded one) followed by one length per symbol.
+        """
+        code_lengths = coder.get_code_lengths()
+        count = max(code_lengths) + 1 if code_lengths else 0
+        return pack(count_format, count) + ''.join(
+                chr(code_lengths.get(symbol, 0)) for symbol in xrange(count))
+
+    def _load_code_lengths(self, data, offset, count_format, count_size):
+        """
+        Restores code packed by _save_code_lengths. Returns the code and
+        offset right after it.
+        """
+        count = unpack_from(count_format, data, offset)[0]
+        offset += count_size
+        packed = bytearray(data[offset:offset + count])
+        if len(packed) != count:
+            raise ValueError("Table of code lengths is truncated.")
+        code_lengths = dict((symbol, length)
+                for symbol, length in enumerate(packed) if length)
+        return CanonicalHuffmanCoding(code_lengths=code_lengths), \
+                offset + count
+
+    def _get_length_codes(self):
+        """
+        Returns list with tuples (symbol, extra bits, quantity of extra
+        bits) for every length of match.
+        """
+        codes = [None] * (MAX_MATCH + 1)
+        for index, base in enumerate(LENGTH_BASES):
+            for extra in xrange(1 << LENGTH_EXTRA_BITS[index]):
+                # The longest match has a symbol of its own
+                if base + extra < MAX_MATCH or base == MAX_MATCH:
+                    codes[base + extra] = (END_SYMBOL + 1 + index, extra,
+                            LENGTH_EXTRA_BITS[index])
+        return codes
+
+    def _get_distance_code(self, distance):
+        """
+        Returns tuple (symbol, extra bits, quantity of extra bits) for
+        distance.
+        """
+        value = distance - 1
+        if value < 4:
+            return value, 0, 0
+        bits = value.bit_length() - 2
+        symbol = 2 * (bits + 1) + ((value >> bits) & 1)
+        return symbol, value & ((1 << bits) - 1), bits
+
+
+if __name__ == '__main__':
+    """First argument - name of file to encode."""
+    from sys import argv
+
+    if len(argv) >= 2:
+        with open(argv[1], 'rb') as file_to_code:
+            input_string = file_to_code.read()
+    else:
+        input_string = 'abracadabra abracadabra abracadabra'
+
+    coder = LZ77Coding(input_string)
+    print coder.get_tokens()[:50]
+    print len(input_string), len(coder.get_coded_string())
+    print coder.decode_string(coder.get_coded_string()) == input_string
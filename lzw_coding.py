@@ -1,6 +1,13 @@
  # -*- coding: utf-8 -*-
 
 from math import log, ceil
+from collections import OrderedDict
+from bit_io import BitWriter, BitReader
+
+# Policies of LZW coding when dictionary is full
+RESET_WHEN_FULL = 'reset'
+RESET_ON_RATIO_DROP = 'ratio'
+EVICT_LEAST_RECENT = 'lru'
 
 class LZ78Coding(object):
     """
@@ -13,6 +20,7 @@ class LZ78Coding(object):
         self._input_string = input_string
         self._coded_string = None
         self._codes = None
+        self._pairs = None
 
     def get_input_string(self):
         """Returns current string to encode."""
@@ -23,6 +31,7 @@ class LZ78Coding(object):
         self._input_string = new_string
         self._coded_string = None
         self._codes = None
+        self._pairs = None
 
     def get_coded_string(self):
         """Returns encoded string (codes it if needed)."""
@@ -38,83 +47,403 @@ class LZ78Coding(object):
                     self._encode_string(self._input_string)
         return self._codes
 
+    def get_pairs(self):
+        """
+        Returns list of pairs (index of longest known word, next letter),
+        one per new word. Index 0 stands for empty word; last pair has no
+        letter (None) if string ends with a known word.
+        """
+        if self._pairs is None:
+            self._pairs = self._divide_to_pairs(self._input_string)
+        return self._pairs
+
+    def decode_string(self, coded_string):
+        """
+        Restores string from coded one.
+
+        coded_string - string produced by get_coded_string
+        """
+        words = ['']
+        result = []
+        position = 0
+        code_length = 0
+        while position < len(coded_string):
+            if len(words) > (1 << code_length):
+                code_length += 1
+            index = 0
+            if code_length:
+                code = coded_string[position:position + code_length]
+                if len(code) != code_length:
+                    raise ValueError("Coded string is truncated.")
+                index = int(code, 2)
+                position += code_length
+            if index >= len(words):
+                raise ValueError("Unknown word in coded string.")
+            word = words[index]
+            if position < len(coded_string):
+                word += coded_string[position]
+                position += 1
+                words.append(word)
+            result.append(word)
+        return ''.join(result)
+
     def _encode_string(self, input_string):
         """Encodes string and returns its code and list of codes."""
-        words = self._divide_to_words(input_string)
-        words_copy = words[::]
-        codes = {'':'0'}
-        coded_string = ''
-        last_code = 0
-
-        # adding first word to dict and resulting string
-        last_code += 1
-        codes[words[0]] = self._get_code_from_number(last_code)
-        coded_string += words[0]
-        words.pop(0)
-
-        # adding rest of words to dict and resulting string
-        for word in words:
-            if not codes.has_key(word):
-                check_word_len = len(word) - 1
-                check_word = word[:check_word_len]
-                coded_string += (codes[check_word] + word[check_word_len:])
-                last_code += 1
-                codes.setdefault(word, 
-                        self._get_code_from_number(last_code))
-                codes = self._add_prefix_zeros_to_code(codes)
-            else:
-                coded_string += codes[word]
-            
-        codes_list = self._get_codes_list(words_copy, codes)
+        pairs = self.get_pairs()
+        coded_parts = []
+        # Index is written with as many bits as needed for the number of
+        # words known at the moment (empty one included)
+        code_length = 0
+        for known_words, (index, letter) in enumerate(pairs, 1):
+            if known_words > (1 << code_length):
+                code_length += 1
+            if code_length:
+                coded_parts.append(
+                        self._get_code_from_number(index).zfill(code_length))
+            if letter is not None:
+                coded_parts.append(letter)
 
-        return coded_string, codes_list
+        return ''.join(coded_parts), self._get_codes_list(pairs)
 
-    def _divide_to_words(self, input_string):
+    def _divide_to_pairs(self, input_string):
         """
-        Divides string to words.
-        Returns list of such words.
+        Divides string to words in one pass over it, keeping known words in
+        a trie: dictionary with pairs (index of word, letter) as keys and
+        indexes of words extended with letter as values.
         """
-        result = []
-        working_string = input_string[::]
-        word_length = 1
-        while working_string:
-            word = working_string[:word_length]
-            if result.count(word) == 0 or word == working_string:
-                result.append(word)
-                working_string = working_string[word_length:]
-                word_length = 1
+        trie = {}
+        pairs = []
+        prefix = 0
+        for letter in input_string:
+            index = trie.get((prefix, letter))
+            if index is None:
+                trie[(prefix, letter)] = len(trie) + 1
+                pairs.append((prefix, letter))
+                prefix = 0
             else:
-                word_length += 1
-        return result
+                prefix = index
+        if prefix:
+            pairs.append((prefix, None))
+        return pairs
 
     def _get_code_from_number(self, number):
         return bin(number)[2:]
 
-    def _add_prefix_zeros_to_code(self, codes):
-        """Adds prefix zeroz to codes to make their lengths equal."""
-        new_codes = {}
-        code_length = ceil(log(len(codes), 2.))
-        for key in codes.iterkeys():
-            new_code = codes[key]
-            new_code_len = len(new_code)
-            if new_code_len < code_length:
-                new_code = '0' * int(code_length - new_code_len) + new_code
-            new_codes[key] = new_code
-        return new_codes
-
-    def _get_codes_list(self, words_list, codes_dict):
+    def _get_codes_list(self, pairs):
         """
-        Returns list of tuples (word, code) with preserved word_list's
-        order.
+        Returns list of tuples (word, code) in order of words' appearance,
+        codes have equal lengths.
         """
+        words_count = len([letter for index, letter in pairs
+            if letter is not None])
+        code_length = int(ceil(log(words_count + 1, 2.)))
+        words = ['']
         result = []
-        for word in words_list:
-            tmp_dict = dict(result)
-            if not tmp_dict.has_key(word):
-                result.append((word, codes_dict[word]))
+        for index, letter in pairs:
+            if letter is None:
+                break
+            word = words[index] + letter
+            words.append(word)
+            result.append((word, self._get_code_from_number(
+                len(words) - 1).zfill(code_length)))
         return result
 
-    
+
+
+class LZWCoding(object):
+    """
+    Represents LZW coding algorithm with bounded dictionary. Codes 0-255
+    stand for bytes, CLEAR_CODE resets dictionary, END_CODE ends coded
+    string; codes are written with 9 bits and grow up to max_code_length
+    bits as dictionary grows.
+
+    input_string - string to be coded
+    max_code_length - quantity of bits in the longest code (dictionary
+        holds 2 ** max_code_length words)
+    policy - what to do when dictionary is full: RESET_WHEN_FULL starts
+        with a new dictionary, RESET_ON_RATIO_DROP keeps dictionary until
+        compression ratio drops, EVICT_LEAST_RECENT replaces least
+        recently used words
+    check_interval - quantity of input bytes between checks of
+        compression ratio (for RESET_ON_RATIO_DROP)
+    seed_words - words (longer than one byte) known from the start and
+        after every reset, e.g. trained on similar strings; every prefix
+        of a word must be a word too (decoder needs the same words)
+    """
+    CLEAR_CODE = 256
+    END_CODE = 257
+
+    def __init__(self, input_string, max_code_length=12,
+            policy=RESET_WHEN_FULL, check_interval=4096, seed_words=()):
+        super(LZWCoding, self).__init__()
+        if not 9 <= max_code_length:
+            raise ValueError("Codes must be at least 9 bits long.")
+        if policy not in (RESET_WHEN_FULL, RESET_ON_RATIO_DROP,
+                EVICT_LEAST_RECENT):
+            raise ValueError("Unknown policy %r." % policy)
+        self._input_string = input_string
+        self._max_code_length = max_code_length
+        self._policy = policy
+        self._check_interval = check_interval
+        self._seed_words = seed_words
+        self._coded_string = None
+        self._codes = None
+
+    def get_input_string(self):
+        """Returns current string to encode."""
+        return self._input_string
+
+    def set_input_string(self, new_string):
+        """Sets current string to encode."""
+        self._input_string = new_string
+        self._coded_string = None
+        self._codes = None
+
+    def get_coded_string(self):
+        """Returns encoded string of packed codes (codes it if needed)."""
+        if self._coded_string is None:
+            self._coded_string, self._codes = \
+                    self._encode_string(self._input_string)
+        return self._coded_string
+
+    def get_codes(self):
+        """Returns list of codes written to coded string."""
+        if self._codes is None:
+            self._coded_string, self._codes = \
+                    self._encode_string(self._input_string)
+        return self._codes
+
+    def decode_string(self, coded_string, offset=0):
+        """
+        Restores string from codes packed by get_coded_string (with the
+        same maximal code length and policy).
+
+        coded_string - string of packed codes
+        offset - position of packed codes in coded_string
+        """
+        dictionary = self._create_dictionary()
+        reader = BitReader(coded_string, offset)
+        words = dictionary.get_seed_words()
+        result = []
+        previous = None
+        while True:
+            new_code = None
+            if previous is not None:
+                new_code = dictionary.allocate(previous)
+            if not reader.get_bits_left():
+                raise ValueError("Coded string is truncated.")
+            code = reader.read(dictionary.get_code_length())
+            if code == self.END_CODE:
+                break
+            if code == self.CLEAR_CODE:
+                dictionary.reset()
+                words = dictionary.get_seed_words()
+                previous = None
+                continue
+            if code < 256:
+                word = chr(code)
+            elif code == new_code:
+                # Word is being defined right now: previous word and its
+                # first letter
+                word = words[previous] + words[previous][0] \
+                        if previous >= 256 else chr(previous) * 2
+            elif code in words and dictionary.contains(code):
+                word = words[code]
+            else:
+                raise ValueError("Unknown code %d in coded string." % code)
+            if new_code is not None:
+                dictionary.assign(new_code, previous, ord(word[0]))
+                words[new_code] = (words[previous] if previous >= 256
+                        else chr(previous)) + word[0]
+            result.append(word)
+            dictionary.touch(code)
+            previous = code
+        return ''.join(result)
+
+    def _encode_string(self, input_string):
+        """Encodes string and returns packed codes and list of codes."""
+        dictionary = self._create_dictionary()
+        writer = BitWriter()
+        codes = []
+        # bytes read and bits written since last check of ratio
+        bytes_read = 0
+        bits_written = writer.get_bits_count()
+        last_ratio = None
+
+        prefix = None
+        for byte in bytearray(input_string):
+            bytes_read += 1
+            if prefix is None:
+                prefix = byte
+                continue
+            code = dictionary.find(prefix, byte)
+            if code is not None:
+                prefix = code
+                continue
+
+            codes.append(prefix)
+            writer.write(prefix, dictionary.get_code_length())
+            dictionary.touch(prefix)
+            new_code = dictionary.allocate(prefix)
+            if new_code is not None:
+                dictionary.assign(new_code, prefix, byte)
+            elif self._policy == RESET_WHEN_FULL:
+                self._write_clear(writer, codes, dictionary)
+            elif self._policy == RESET_ON_RATIO_DROP and \
+                    bytes_read >= self._check_interval:
+                ratio = float(bytes_read) / \
+                        (writer.get_bits_count() - bits_written)
+                bytes_read = 0
+                bits_written = writer.get_bits_count()
+                if last_ratio is not None and ratio < last_ratio:
+                    self._write_clear(writer, codes, dictionary)
+                    last_ratio = None
+                else:
+                    last_ratio = ratio
+            prefix = byte
+
+        if prefix is not None:
+            codes.append(prefix)
+            writer.write(prefix, dictionary.get_code_length())
+            dictionary.touch(prefix)
+            # Decoder reserves a code for the next word before reading
+            # each code, so code length must account for it
+            dictionary.allocate(prefix)
+        codes.append(self.END_CODE)
+        writer.write(self.END_CODE, dictionary.get_code_length())
+        return writer.get_bytes(), codes
+
+    def _create_dictionary(self):
+        """Returns new dictionary for coding or decoding."""
+        return _LZWDictionary(self._max_code_length,
+                self._policy == EVICT_LEAST_RECENT, self._seed_words)
+
+    def _write_clear(self, writer, codes, dictionary):
+        """Writes CLEAR_CODE and resets dictionary."""
+        codes.append(self.CLEAR_CODE)
+        writer.write(self.CLEAR_CODE, dictionary.get_code_length())
+        dictionary.reset()
+
+
+class _LZWDictionary(object):
+    """
+    Dictionary of LZW words shared by encoder and decoder, so both make
+    the same decisions. Word is known by its prefix code and last byte;
+    codes 0-255 are single bytes and are never removed.
+
+    max_code_length - quantity of bits in the longest code
+    evict - whether least recently used words are replaced when
+        dictionary is full (only words that aren't prefixes of other words
+        can be replaced)
+    seed_words - words added after every reset, shorter words get
+        smaller codes
+    """
+    FIRST_CODE = 258
+
+    def __init__(self, max_code_length, evict, seed_words=()):
+        super(_LZWDictionary, self).__init__()
+        self._size = 1 << max_code_length
+        self._evict = evict
+        self._seed = self._find_seed_pairs(seed_words)
+        self.reset()
+
+    def reset(self):
+        """Removes all words longer than one byte except seed words."""
+        self._codes = {}
+        self._words = {}
+        self._children = {}
+        self._unused = OrderedDict()
+        self._next_code = self.FIRST_CODE
+        for prefix, byte in self._seed:
+            self.assign(self.allocate(prefix), prefix, byte)
+
+    def get_seed_words(self):
+        """Returns dictionary with codes of seed words and the words."""
+        words = {}
+        for code, (prefix, byte) in enumerate(self._seed, self.FIRST_CODE):
+            words[code] = (words[prefix] if prefix >= 256 else chr(prefix)) \
+                    + chr(byte)
+        return words
+
+    def get_code_length(self):
+        """Returns quantity of bits needed for the biggest code in use."""
+        return max(9, (self._next_code - 1).bit_length())
+
+    def contains(self, code):
+        """Checks whether code stands for a word."""
+        return code < 256 or code in self._words
+
+    def find(self, prefix, byte):
+        """Returns code of word prefix + byte (None if it's unknown)."""
+        return self._codes.get((prefix, byte))
+
+    def touch(self, code):
+        """Marks word as recently used."""
+        if code in self._unused:
+            del self._unused[code]
+            self._unused[code] = True
+
+    def allocate(self, prefix):
+        """
+        Returns code for a new word with given prefix (None if dictionary
+        is full and no word can be replaced).
+        """
+        if self._next_code < self._size:
+            self._next_code += 1
+            return self._next_code - 1
+        if not self._evict:
+            return None
+        for code in self._unused:
+            if code != prefix:
+                self._remove(code)
+                return code
+        return None
+
+    def assign(self, code, prefix, byte):
+        """Makes code stand for word prefix + byte."""
+        self._codes[(prefix, byte)] = code
+        self._words[code] = (prefix, byte)
+        self._children[prefix] = self._children.get(prefix, 0) + 1
+        if self._evict:
+            self._unused.pop(prefix, None)
+            self._unused[code] = True
+
+    def _find_seed_pairs(self, seed_words):
+        """
+        Returns list of pairs (prefix code, byte) of seed words in order of
+        their codes.
+        """
+        seed_words = sorted(set(seed_words), key=lambda word: (len(word),
+            word))
+        # Codes of seed words are known before words are added
+        codes = {}
+        pairs = []
+        for code, word in enumerate(seed_words, self.FIRST_CODE):
+            if len(word) < 2:
+                raise ValueError("Seed words must be longer than one byte.")
+            prefix = word[:-1]
+            prefix_code = ord(prefix) if len(prefix) == 1 \
+                    else codes.get(prefix)
+            if prefix_code is None:
+                raise ValueError("Prefix of seed word %r is missing." % word)
+            codes[word] = code
+            pairs.append((prefix_code, ord(word[-1])))
+        if self.FIRST_CODE + len(pairs) >= self._size:
+            raise ValueError("Too many seed words for code length.")
+        return pairs
+
+    def _remove(self, code):
+        """Removes word that isn't a prefix of other words."""
+        prefix, byte = self._words.pop(code)
+        del self._codes[(prefix, byte)]
+        del self._unused[code]
+        self._children[prefix] -= 1
+        if not self._children[prefix]:
+            del self._children[prefix]
+            if prefix >= self.FIRST_CODE:
+                self._unused[prefix] = True
+
+
 if __name__ == '__main__':
     """First argument - string to encode."""
     from sys import argv
@@ -128,5 +457,9 @@ if __name__ == '__main__':
     print coder.get_coded_string()
     print coder.get_codes()
 
+    lzw_coder = LZWCoding(input_string)
+    print lzw_coder.get_codes()
+    print lzw_coder.decode_string(lzw_coder.get_coded_string())
+
 
     
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+import os
+from struct import pack, unpack_from
+from zlib import crc32
+from coding_algorithms import CanonicalHuffmanCoding, \
+        LengthLimitedHuffmanCoding
+from entropy_utils import count_bytes
+
+# First bytes of file with a dictionary, last one is version of format
+DICTIONARY_SIGNATURE = 'CTD\x01'
+DICTIONARY_EXTENSION = 'ctd'
+# Directories with installed dictionaries (separated like in PATH)
+DICTIONARY_PATH_VARIABLE = 'CTF_DICTIONARY_PATH'
+DEFAULT_DICTIONARY_DIRECTORY = os.path.join('~', '.ctf', 'dictionaries')
+# How much weight of byte values met in samples exceeds weight of others
+TRAINED_TABLE_SCALE = 1 << 8
+# Limit of lengths of codes of trained Huffman's code
+TRAINED_MAX_CODE_LENGTH = 12
+
+class SharedDictionary(object):
+    """
+    Represents dictionary trained on samples of similar small messages:
+    Huffman's code suiting any message and seed words of LZW coding.
+    Compressed messages refer to dictionary by its number (derived from
+    its contents), so neither table nor words are stored in them.
+
+    huffman_table - CanonicalHuffmanCoding of all byte values
+    seed_words - list of words for LZW coding (see lzw_coding.LZWCoding)
+    """
+    def __init__(self, huffman_table, seed_words=()):
+        super(SharedDictionary, self).__init__()
+        self._huffman_table = huffman_table
+        self._seed_words = sorted(set(seed_words),
+                key=lambda word: (len(word), word))
+        self._contents = self._pack_contents()
+        self._id = (crc32(self._contents) & 0xffffffff) or 1
+
+    @classmethod
+    def train(cls, samples, max_words=1024, max_word_length=64):
+        """
+        Creates dictionary from samples: Huffman's code is built for
+        frequencies of bytes in all samples (other bytes get long codes),
+        seed words are the most useful words of LZW coding of samples
+        together with their prefixes.
+
+        samples - list of strings
+        max_words - quantity of seed words (0 - no seed words)
+        max_word_length - length of the longest seed word
+        """
+        counts = [0] * 256
+        for sample in samples:
+            for value, count in enumerate(count_bytes(sample)):
+                counts[value] += count
+        # Bytes never met in samples would get very long codes otherwise
+        huffman_table = LengthLimitedHuffmanCoding(dict(
+            (chr(value), count * TRAINED_TABLE_SCALE + 1)
+            for value, count in enumerate(counts)), TRAINED_MAX_CODE_LENGTH)
+        seed_words = []
+        if max_words:
+            seed_words = cls._find_seed_words(samples, max_words,
+                    max_word_length)
+        return cls(huffman_table, seed_words)
+
+    @classmethod
+    def from_string(cls, data):
+        """
+        Restores dictionary from string made by to_string.
+
+        data - string with dictionary
+        """
+        if not data.startswith(DICTIONARY_SIGNATURE):
+            raise ValueError("Not a dictionary.")
+        offset = len(DICTIONARY_SIGNATURE) + 4
+        if len(data) < offset:
+            raise ValueError("Dictionary is truncated.")
+        huffman_table, offset = \
+                CanonicalHuffmanCoding.deserialize_code_lengths(data, offset)
+        if len(data) < offset + 2:
+            raise ValueError("Dictionary is truncated.")
+        words_count = unpack_from('>H', data, offset)[0]
+        offset += 2
+        seed_words = []
+        for i in xrange(words_count):
+            length = ord(data[offset:offset + 1] or '\x00')
+            word = data[offset + 1:offset + 1 + length]
+            if not length or len(word) != length:
+                raise ValueError("Dictionary is truncated.")
+            seed_words.append(word)
+            offset += 1 + length
+        dictionary = cls(huffman_table, seed_words)
+        if dictionary.get_id() != unpack_from('>I', data,
+                len(DICTIONARY_SIGNATURE))[0]:
+            raise ValueError("Dictionary is damaged.")
+        return dictionary
+
+    @classmethod
+    def load(cls, filename):
+        """Reads dictionary from a file."""
+        with open(filename, 'rb') as dictionary_file:
+            return cls.from_string(dictionary_file.read())
+
+    def get_id(self):
+        """Returns number of dictionary."""
+        return self._id
+
+    def get_huffman_table(self):
+        """Returns Huffman's code of all byte values."""
+        return self._huffman_table
+
+    def get_seed_words(self):
+        """Returns list of seed words of LZW coding."""
+        return self._seed_words
+
+    def to_string(self):
+        """
+        Returns dictionary packed into string: signature, number, code
+        lengths of Huffman's code, quantity of seed words and the words
+        (each after its length).
+        """
+        return DICTIONARY_SIGNATURE + pack('>I', self._id) + self._contents
+
+    def save(self, filename):
+        """Writes dictionary to a file."""
+        with open(filename, 'wb') as dictionary_file:
+            dictionary_file.write(self.to_string())
+
+    def install(self, directory=None):
+        """
+        Writes dictionary to a directory with name found by its number
+        (see find_dictionary). Returns name of the file.
+
+        directory - directory to write to (the first one of dictionary
+            path by default)
+        """
+        if directory is None:
+            directory = get_dictionary_path()[0]
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        filename = os.path.join(directory, get_dictionary_filename(self._id))
+        self.save(filename)
+        return filename
+
+    def _pack_contents(self):
+        """Packs code lengths and seed words."""
+        parts = [self._huffman_table.serialize_code_lengths(),
+                pack('>H', len(self._seed_words))]
+        for word in self._seed_words:
+            parts.append(chr(len(word)) + word)
+        return ''.join(parts)
+
+    @classmethod
+    def _find_seed_words(cls, samples, max_words, max_word_length):
+        """
+        Returns the most useful words of LZW coding of samples: every word
+        is scored by quantity of its uses multiplied by bytes it saves,
+        words are taken with their prefixes while there is place for them.
+        """
+        # Words are learned over all samples, as if they were one string
+        uses = {}
+        known = set()
+        for sample in samples:
+            word = ''
+            for letter in sample:
+                if word + letter in known or not word:
+                    word += letter
+                    continue
+                uses[word] = uses.get(word, 0) + 1
+                if len(word) < max_word_length:
+                    known.add(word + letter)
+                word = letter
+            if word:
+                uses[word] = uses.get(word, 0) + 1
+        candidates = sorted((word for word in uses if len(word) > 1),
+                key=lambda word: (-uses[word] * (len(word) - 1), word))
+        chosen = set()
+        for word in candidates:
+            missing = [word[:length] for length in xrange(2, len(word) + 1)
+                    if word[:length] not in chosen]
+            if len(chosen) + len(missing) <= max_words:
+                chosen.update(missing)
+            if len(chosen) == max_words:
+                break
+        return chosen
+
+
+def get_dictionary_path():
+    """Returns list of directories with installed dictionaries."""
+    path = os.environ.get(DICTIONARY_PATH_VARIABLE)
+    if path:
+        return path.split(os.pathsep)
+    return [DEFAULT_DICTIONARY_DIRECTORY]
+
+
+def get_dictionary_filename(dictionary_id):
+    """Returns name of file with installed dictionary."""
+    return '%08x.%s' % (dictionary_id, DICTIONARY_EXTENSION)
+
+
+def find_dictionary(dictionary_id, directories=None):
+    """
+    Loads installed dictionary by its number.
+
+    dictionary_id - number of dictionary
+    directories - list of directories to look in (dictionary path by
+        default)
+    """
+    for directory in directories or get_dictionary_path():
+        filename = os.path.join(os.path.expanduser(directory),
+                get_dictionary_filename(dictionary_id))
+        if os.path.exists(filename):
+            return SharedDictionary.load(filename)
+    raise ValueError("Dictionary %08x is not found." % dictionary_id)
+
+
+if __name__ == '__main__':
+    """Trains dictionary on sample files, run with --help to see options."""
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Trains shared dictionary.')
+    parser.add_argument('samples', nargs='+', help='files with samples')
+    parser.add_argument('-o', '--output',
+            help='file to write dictionary to (installed by default)')
+    parser.add_argument('--max-words', type=int, default=1024,
+            help='quantity of LZW seed words (0 - none)')
+    arguments = parser.parse_args()
+
+    samples = []
+    for filename in arguments.samples:
+        with open(filename, 'rb') as sample_file:
+            samples.append(sample_file.read())
+    dictionary = SharedDictionary.train(samples, arguments.max_words)
+    if arguments.output:
+        dictionary.save(arguments.output)
+        print '%08x' % dictionary.get_id()
+    else:
+        print '%08x %s' % (dictionary.get_id(), dictionary.install())
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import os
+import cPickle
+from math import log
+from collections import OrderedDict
+from threading import Lock
+
+# Version of file with cached tables, files of other versions are ignored
+CACHE_FILE_VERSION = 1
+
+class TableCache(object):
+    """
+    Represents size-bounded cache of codec tables (e.g. Huffman's codes)
+    keyed by fingerprint of distribution of bytes, so blocks with similar
+    distributions share a table instead of building it again. Least
+    recently used table is evicted when cache is full.
+
+    Fingerprint keeps quantized -log2 of probabilities of frequent byte
+    values, which is close to lengths of their codes; rare values are
+    treated as absent. So blocks with the same fingerprint may have
+    different sets of values, cached table is used only if it suits a
+    block, otherwise it's replaced by a new one (which may be built to
+    suit both blocks).
+
+    max_size - quantity of tables kept
+    resolution - quantity of quantization levels per bit
+    max_bits - values with -log2 of probability above it are rare
+    filename - file with tables kept between runs (see load and save),
+        it's unpickled, so only trusted files must be used
+    """
+    def __init__(self, max_size=256, resolution=1, max_bits=6,
+            filename=None):
+        super(TableCache, self).__init__()
+        self._max_size = max_size
+        self._resolution = resolution
+        self._max_bits = max_bits
+        self._filename = filename
+        self._tables = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def get_size(self):
+        """Returns quantity of cached tables."""
+        return len(self._tables)
+
+    def get_statistics(self):
+        """Returns tuple (quantity of hits, quantity of misses)."""
+        return self._hits, self._misses
+
+    def get_fingerprint(self, counts):
+        """
+        Returns fingerprint of distribution: string with one byte per value,
+        0 for rare values and quantized -log2 of probability plus 1 for
+        others.
+
+        counts - list of quantities of every byte value
+        """
+        total = float(sum(counts))
+        # Values rarer than this are left out
+        lowest = total / (1 << self._max_bits)
+        levels = bytearray(len(counts))
+        for value, count in enumerate(counts):
+            if count and count >= lowest:
+                levels[value] = 1 + int(round(-log(count / total, 2.) *
+                    self._resolution))
+        return str(levels)
+
+    def get_table(self, namespace, counts, create_table, suits_table=None):
+        """
+        Returns cached table for distribution or creates and caches a new
+        one.
+
+        namespace - hashable value separating tables of different codecs
+            (and their options)
+        counts - list of quantities of every byte value
+        create_table - function creating the table, it gets cached table
+            with the same fingerprint that doesn't suit (None if there is
+            no such table)
+        suits_table - function checking whether cached table suits (any
+            table suits by default)
+        """
+        key = (namespace, self.get_fingerprint(counts))
+        with self._lock:
+            table = self._tables.pop(key, None)
+            if table is not None:
+                self._tables[key] = table
+                if suits_table is None or suits_table(table):
+                    self._hits += 1
+                    return table
+            self._misses += 1
+        table = create_table(table)
+        self.put_table(key, table)
+        return table
+
+    def put_table(self, key, table):
+        """
+        Caches a table (evicting least recently used one if needed).
+
+        key - tuple (namespace, fingerprint)
+        table - table to keep
+        """
+        with self._lock:
+            self._tables.pop(key, None)
+            self._tables[key] = table
+            while len(self._tables) > self._max_size:
+                self._tables.popitem(last=False)
+
+    def clear(self):
+        """Removes all tables."""
+        with self._lock:
+            self._tables.clear()
+
+    def load(self, filename=None):
+        """
+        Adds tables from file saved by save (files saved with other
+        parameters of fingerprint are ignored).
+
+        filename - name of file (filename of cache by default)
+        """
+        with open(filename or self._filename, 'rb') as cache_file:
+            try:
+                version, parameters, items = cPickle.load(cache_file)
+            except (EOFError, ValueError, TypeError, cPickle.PickleError):
+                return
+        if version != CACHE_FILE_VERSION or \
+                parameters != (self._resolution, self._max_bits):
+            return
+        for key, table in items:
+            self.put_table(key, table)
+
+    def save(self, filename=None):
+        """
+        Writes tables to file, file is replaced at once so readers never
+        see it half-written.
+
+        filename - name of file (filename of cache by default)
+        """
+        filename = filename or self._filename
+        with self._lock:
+            items = self._tables.items()
+        temporary_filename = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary_filename, 'wb') as cache_file:
+            cPickle.dump((CACHE_FILE_VERSION,
+                (self._resolution, self._max_bits), items), cache_file,
+                cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_filename, filename)
+
+
+_shared_cache = None
+_shared_cache_lock = Lock()
+
+
+def get_shared_cache():
+    """Returns cache shared by whole process (creates it if needed)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TableCache()
+        return _shared_cache
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+from struct import unpack_from
+from binascii import hexlify
+
+class TableDecoder(object):
+    """
+    Decodes bits packed by BitWriter for any prefix code (Huffman's, Fano's,
+    canonical) using lookup tables instead of walking code tree bit by bit.
+
+    Main table is indexed by next table_bits bits and keeps all letters
+    whose codes fit in them entirely, so one probe may decode several
+    letters. Codes longer than table_bits are found in second-level tables
+    indexed by the rest of the bits.
+
+    coded_alphabet - list of tuples (letter, code) or dictionary with
+        letters and their codes ('0101...' strings)
+    table_bits - quantity of bits used to index main table
+    """
+    def __init__(self, coded_alphabet, table_bits=12):
+        super(TableDecoder, self).__init__()
+        codes = dict(coded_alphabet)
+        self._max_length = max([len(code) for code in codes.itervalues()] \
+                or [0])
+        self._table_bits = max(1, min(table_bits, self._max_length))
+        self._string_letters = all(
+                isinstance(letter, str) and len(letter) == 1
+                for letter in codes)
+        self._single = None
+        self._table = self._build_tables(codes)
+
+    def get_table_bits(self):
+        """Returns quantity of bits used to index main table."""
+        return self._table_bits
+
+    def decode(self, data, count, offset=0):
+        """
+        Decodes count letters and returns them (as string if letters are
+        strings, otherwise as list).
+
+        data - string with packed codes
+        count - quantity of letters to decode
+        offset - position of first byte with codes in data
+        """
+        table = self._table
+        bits = self._table_bits
+        mask = (1 << bits) - 1
+        data_length = len(data)
+        parts = []
+        append = parts.append
+        decoded = 0
+        accumulator = 0
+        in_accumulator = 0
+        position = offset
+        padding_bits = 0
+        while decoded < count:
+            if in_accumulator < self._max_length:
+                # Refilling with 8 bytes at once (zeros past the end)
+                accumulator &= (1 << in_accumulator) - 1
+                if position + 8 <= data_length:
+                    accumulator = (accumulator << 64) | \
+                            unpack_from('>Q', data, position)[0]
+                    in_accumulator += 64
+                    position += 8
+                else:
+                    chunk = data[position:position + 8]
+                    position += 8
+                    padding = 8 - len(chunk)
+                    padding_bits += 8 * padding
+                    if padding_bits > self._max_length + 64:
+                        raise ValueError("Unexpected end of coded data.")
+                    accumulator = (accumulator << 64) | \
+                            (int(hexlify(chunk) or '0', 16) << (8 * padding))
+                    in_accumulator += 64
+                continue
+            letters, used, subtable = \
+                    table[(accumulator >> (in_accumulator - bits)) & mask]
+            if used:
+                append(letters)
+                decoded += len(letters)
+                in_accumulator -= used
+            elif subtable is not None:
+                in_accumulator -= bits
+                while True:
+                    sub_bits, entries = subtable
+                    letter, length = entries[
+                            (accumulator >> (in_accumulator - sub_bits)) &
+                            ((1 << sub_bits) - 1)]
+                    if length:
+                        break
+                    if letter is None:
+                        raise ValueError("Invalid code in coded data.")
+                    in_accumulator -= sub_bits
+                    subtable = letter
+                append(letter if self._string_letters else (letter,))
+                decoded += 1
+                in_accumulator -= length
+            else:
+                raise ValueError("Invalid code in coded data.")
+
+        if self._string_letters:
+            result = ''.join(parts)
+        else:
+            result = [letter for part in parts for letter in part]
+        # Last probe may decode letters from padding bits
+        return result[:count]
+
+    def decode_symbol(self, reader):
+        """
+        Decodes one letter from BitReader and returns it.
+
+        reader - BitReader positioned at letter's code
+        """
+        table_bits = self._table_bits
+        entries = self._single
+        while True:
+            letter, length = entries[reader.peek(table_bits)]
+            if length:
+                reader.skip(length)
+                return letter
+            if letter is None:
+                raise ValueError("Invalid code in coded data.")
+            reader.skip(table_bits)
+            table_bits, entries = letter
+
+    def _build_tables(self, codes):
+        """
+        Builds main table of tuples (letters, used bits, subtable) and table
+        of single letters (self._single). Returns main table.
+        """
+        bits = self._table_bits
+        size = 1 << bits
+        single = self._build_level(codes, bits)[1]
+        self._single = single
+
+        table = []
+        mask = size - 1
+        for index in xrange(size):
+            letters = []
+            used = 0
+            while True:
+                letter, length = single[(index << used) & mask]
+                if not length or used + length > bits:
+                    break
+                letters.append(letter)
+                used += length
+            subtable = None
+            if not used and single[index][0] is not None:
+                subtable = single[index][0]
+            if self._string_letters:
+                letters = ''.join(letters)
+            else:
+                letters = tuple(letters)
+            table.append((letters, used, subtable))
+        return table
+
+    def _build_level(self, codes, bits):
+        """
+        Builds table of one level indexed by next bits bits and returns
+        tuple (bits, entries). Entries are tuples (letter, length) for codes
+        that end on this level and (subtable, 0) for longer codes; unused
+        entries are (None, 0).
+
+        codes - dictionary with letters and rests of their codes
+        bits - quantity of bits used to index the table
+        """
+        entries = [(None, 0)] * (1 << bits)
+        long_codes = {}
+        for letter, code in codes.iteritems():
+            length = len(code)
+            if length <= bits:
+                first = int(code, 2) << (bits - length)
+                for index in xrange(first, first + (1 << (bits - length))):
+                    entries[index] = (letter, length)
+            else:
+                long_codes.setdefault(int(code[:bits], 2), {})[letter] = \
+                        code[bits:]
+        for prefix, rests in long_codes.iteritems():
+            sub_bits = min(self._table_bits,
+                    max([len(rest) for rest in rests.itervalues()]))
+            entries[prefix] = (self._build_level(rests, sub_bits), 0)
+        return bits, entries
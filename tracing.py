@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from sys import stdout
+from time import time
+
+class Tracer(object):
+    """
+    Describes interface of tracers: receivers of events reported by coding
+    algorithms (merges, partitions, intervals) and of timings of stages of
+    compression. Tracing is off unless a tracer is set, nothing is
+    reported or measured then.
+    """
+    def event(self, source, name, details):
+        """
+        Receives an event.
+
+        source - name of class reporting event
+        name - name of event
+        details - dictionary with data of event
+        """
+        pass
+
+    def stage(self, name, seconds, bytes_in, bytes_out):
+        """
+        Receives timing of a stage.
+
+        name - name of stage (e.g. 'histogram', 'table', 'encode', 'write')
+        seconds - time taken by stage
+        bytes_in - quantity of bytes given to stage
+        bytes_out - quantity of bytes produced by stage
+        """
+        pass
+
+
+class PrintTracer(Tracer):
+    """
+    Prints every event and stage (like debugging output of algorithms
+    used to do).
+
+    stream - file to print to (standard output by default)
+    """
+    def __init__(self, stream=None):
+        super(PrintTracer, self).__init__()
+        self._stream = stream
+
+    def event(self, source, name, details):
+        print >> self._stream or stdout, '%s %s: %s' % (source, name,
+                ', '.join('%s=%r' % item for item in
+                    sorted(details.iteritems())))
+
+    def stage(self, name, seconds, bytes_in, bytes_out):
+        print >> self._stream or stdout, \
+                'stage %s: %.6f s, %d bytes in, %d bytes out' % (name,
+                        seconds, bytes_in, bytes_out)
+
+
+class RecordingTracer(Tracer):
+    """
+    Keeps all events and sums timings of stages of the same name.
+
+    keep_events - whether events are kept (only stages otherwise)
+    """
+    def __init__(self, keep_events=True):
+        super(RecordingTracer, self).__init__()
+        self._keep_events = keep_events
+        self._events = []
+        self._stages = {}
+
+    def get_events(self):
+        """Returns list of tuples (source, name, details) of events."""
+        return self._events
+
+    def get_stages(self):
+        """
+        Returns dictionary with names of stages and dictionaries with
+        their totals: 'calls', 'seconds', 'bytes_in' and 'bytes_out'.
+        """
+        return self._stages
+
+    def event(self, source, name, details):
+        if self._keep_events:
+            self._events.append((source, name, details))
+
+    def stage(self, name, seconds, bytes_in, bytes_out):
+        totals = self._stages.get(name)
+        if totals is None:
+            totals = {'calls': 0, 'seconds': 0., 'bytes_in': 0,
+                    'bytes_out': 0}
+            self._stages[name] = totals
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['bytes_in'] += bytes_in
+        totals['bytes_out'] += bytes_out
+
+
+class Traceable(object):
+    """
+    Adds tracer to a class. Callers must check that tracer is set before
+    reporting, so disabled tracing costs a single comparison.
+    """
+    _tracer = None
+
+    def get_tracer(self):
+        """Returns current tracer (None if tracing is off)."""
+        return self._tracer
+
+    def set_tracer(self, new_tracer):
+        """Sets tracer (None turns tracing off)."""
+        self._tracer = new_tracer
+
+    def _trace(self, name, **details):
+        """Reports event to tracer."""
+        self._tracer.event(self.__class__.__name__, name, details)
+
+    def _trace_stage(self, name, started, bytes_in, bytes_out):
+        """
+        Reports stage to tracer.
+
+        started - time stage started at (see time.time)
+        """
+        self._tracer.stage(name, time() - started, bytes_in, bytes_out)